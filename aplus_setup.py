@@ -7,6 +7,7 @@ If necessary, edit this setup to select the loaded directives.
 '''
 import toc_config
 import aplus_nodes
+import lib.profiler as profiler
 from directives.meta import AplusMeta
 from directives.questionnaire import Questionnaire, SingleChoice, MultipleChoice, FreeText, AgreeGroup, AgreeItem, AgreeItemGenerate
 from directives.submit import SubmitForm
@@ -20,42 +21,50 @@ from directives.acos_submit import ACOSSubmitDirective
 
 def setup(app):
 
-    # Register new settings.
-    app.add_config_value('course_title', None, 'html')
-    app.add_config_value('submit_title', "{config_title}", 'html')
-    app.add_config_value('course_open_date', None, 'html')
-    app.add_config_value('course_close_date', None, 'html')
-    app.add_config_value('aplusmeta_substitutions', {}, 'html')
-    app.add_config_value('questionnaire_default_submissions', 5, 'html')
-    app.add_config_value('program_default_submissions', 10, 'html')
-    app.add_config_value('default_min_group_size', 1, 'html')
-    app.add_config_value('default_max_group_size', 1, 'html')
-    app.add_config_value('default_late_date', None, 'html')
-    app.add_config_value('default_late_penalty', 0.0, 'html')
-    app.add_config_value('use_wide_column', True, 'html')
-    app.add_config_value('append_content', [], 'html')
-    app.add_config_value('override', {}, 'html')
-    app.add_config_value('category_names', {}, 'html')
-    app.add_config_value('categories', {}, 'html')
+    # Register new settings. The documents that use a setting are read again
+    # when it changes (lib.dependencies), and the index stage uses the current
+    # settings in every build, so the settings do not rebuild everything.
+    app.add_config_value('course_title', None, '')
+    app.add_config_value('submit_title', "{config_title}", '')
+    app.add_config_value('course_open_date', None, '')
+    app.add_config_value('course_close_date', None, '')
+    app.add_config_value('aplusmeta_substitutions', {}, '')
+    app.add_config_value('questionnaire_default_submissions', 5, '')
+    app.add_config_value('program_default_submissions', 10, '')
+    app.add_config_value('default_min_group_size', 1, '')
+    app.add_config_value('default_max_group_size', 1, '')
+    app.add_config_value('default_late_date', None, '')
+    app.add_config_value('default_late_penalty', 0.0, '')
+    app.add_config_value('use_wide_column', True, '')
+    app.add_config_value('append_content', [], '')
+    app.add_config_value('override', {}, '')
+    app.add_config_value('category_names', {}, '')
+    app.add_config_value('categories', {}, '')
     app.add_config_value('static_host', None, 'html')
-    app.add_config_value('ae_default_submissions', 0, 'html')
-    app.add_config_value('skip_language_inconsistencies', False, 'html')
-    app.add_config_value('allow_assistant_viewing', True, 'html')
-    app.add_config_value('allow_assistant_grading', False, 'html')
+    app.add_config_value('yaml_dir', None, 'env')
+    app.add_config_value('index_fingerprints', False, 'html')
+    app.add_config_value('index_defaults', False, '')
+    app.add_config_value('lazy_load_media', False, 'html')
+    app.add_config_value('add_image_sizes', False, 'html')
+    app.add_config_value('ae_default_submissions', 0, '')
+    app.add_config_value('skip_language_inconsistencies', False, '')
+    app.add_config_value('allow_assistant_viewing', True, '')
+    app.add_config_value('allow_assistant_grading', False, '')
     app.add_config_value('enable_rst_file_language_detection', True, 'html')
-    app.add_config_value('course_head_urls', None, 'html')
-    app.add_config_value('bootstrap_styled_topic_classes', 'dl-horizontal topic', 'html')
-    app.add_config_value('acos_submit_base_url', 'http://172.21.0.2:3000', 'html')
+    app.add_config_value('course_head_urls', None, '')
+    app.add_config_value('bootstrap_styled_topic_classes', 'dl-horizontal topic', '')
+    app.add_config_value('acos_submit_base_url', 'http://172.21.0.2:3000', '')
     app.add_config_value('enable_doc_link_multilang_suffix_correction', False, 'html')
     app.add_config_value('enable_ref_link_multilang_suffix_correction', False, 'html')
-    app.add_config_value('reveal_submission_feedback', None, 'html')
-    app.add_config_value('reveal_model_solutions', None, 'html')
-    app.add_config_value('enable_autosave', False, 'html')
-    app.add_config_value('disable_duplicate_check', False, 'html')
-    app.add_config_value('unprotected_paths', [], 'html')
-    app.add_config_value('default_exercise_url', None, 'html')
-    app.add_config_value('default_configure_url', None, 'html')
-    app.add_config_value('course_configures', [], 'html')
+    app.add_config_value('reveal_submission_feedback', None, '')
+    app.add_config_value('reveal_model_solutions', None, '')
+    app.add_config_value('enable_autosave', False, '')
+    app.add_config_value('disable_duplicate_check', False, '')
+    app.add_config_value('unprotected_paths', [], '')
+    app.add_config_value('default_exercise_url', None, '')
+    app.add_config_value('default_configure_url', None, '')
+    app.add_config_value('course_configures', [], '')
+    app.add_config_value('configure_file_hashes', False, '')
 
     # Connect configuration generation to events.
     app.connect('builder-inited', toc_config.prepare)
@@ -64,7 +73,24 @@ def setup(app):
                 toc_config.add_lang_suffix_to_links(app, docname, source))
     app.connect('doctree-resolved', lambda app, doctree, docname:
                 toc_config.set_config_language_for_doc(app, docname, None))
-    app.connect('build-finished', toc_config.write)
+    app.connect('build-finished', profiler.timed('toc_config.write', toc_config.write))
+
+    # Self-hosted and bundled theme assets (the bundle_assets theme option).
+    app.setup_extension('lib.theme_assets')
+    # Precompressed .gz and .br files (the precompress_output setting).
+    app.setup_extension('lib.precompress')
+    # Manifest and delta archive of the output (the delta_manifest setting).
+    app.setup_extension('lib.delta')
+    # Build profiler (the build_profile setting).
+    app.setup_extension('lib.profiler')
+    # Hashes of the configure files (the configure_file_hashes setting).
+    app.setup_extension('lib.file_hashes')
+    # Threaded reads of the exercise config files (the prefetch_configs setting).
+    app.setup_extension('lib.prefetch')
+    # Tracking of the documents that use the settings.
+    app.setup_extension('lib.dependencies')
+    # Builds of some modules of the course (the build_modules setting).
+    app.setup_extension('lib.shards')
 
     # Add node type that can describe HTML elements and store configurations.
     app.add_node(
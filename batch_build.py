@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+'''
+Batch builds: builds many courses in parallel processes.
+
+The courses are built with sphinx-build in a pool of worker processes. Sphinx,
+docutils and the extensions of the tools are imported before the workers are
+forked, so each worker starts with the modules already loaded. A worker
+builds one course and exits, so the courses do not share any state.
+
+The preloaded extensions are the ones next to this script. A course that
+ships its own copy of the tools (a-plus-rst-tools in the course directory,
+added to sys.path by its conf.py) would silently build with the preloaded
+modules instead, so the extensions are not preloaded if any course of the
+batch has its own copy. Only Sphinx is preloaded then.
+
+The build times are saved into a history file. The next batch starts the
+courses that took the longest time first (and the courses without a previous
+time before them), so that a long course does not start last and delay the
+end of the batch. The summary lists the time, the number of warnings and the
+status of each course. The output of each build is written into
+_build/batch_build.log of the course.
+
+Examples:
+
+    python3 a-plus-rst-tools/batch_build.py --workers 4 course1 course2 course3
+    python3 a-plus-rst-tools/batch_build.py --file courses.txt --report summary.json
+'''
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HISTORY = os.path.join(os.path.expanduser('~'), '.cache', 'aplus-batch-build.json')
+
+
+def preload(extensions=True):
+    ''' Imports the modules of the builds before the workers are forked. '''
+    import sphinx.application
+    import sphinx.builders.html
+    import sphinx.cmd.build
+    if not extensions:
+        return
+    for path in (TOOLS_DIR, os.path.join(TOOLS_DIR, 'directives')):
+        if path not in sys.path:
+            sys.path.append(path)
+    import aplus_setup
+
+
+def own_tools(course):
+    ''' Returns True if the course has a copy of the tools other than this one. '''
+    path = os.path.join(course, 'a-plus-rst-tools')
+    return os.path.isdir(path) and os.path.realpath(path) != os.path.realpath(TOOLS_DIR)
+
+
+def build_course(task):
+    ''' Builds a course in a worker process. '''
+    course, clean = task
+    from sphinx.cmd.build import build_main
+    if own_tools(course):
+        # The directory of this script is the first entry of sys.path, and it
+        # would shadow the tools that conf.py adds to the path.
+        tools = {os.path.realpath(TOOLS_DIR), os.path.realpath(os.path.join(TOOLS_DIR, 'directives'))}
+        sys.path[:] = [path for path in sys.path if os.path.realpath(path or '.') not in tools]
+    build_dir = os.path.join(course, '_build')
+    os.makedirs(build_dir, exist_ok=True)
+    log_path = os.path.join(build_dir, 'batch_build.log')
+    warnings_path = os.path.join(build_dir, 'batch_build_warnings.log')
+    argv = ['-q', '-b', 'html', '-w', warnings_path]
+    if clean:
+        argv.append('-E')
+    argv += [course, os.path.join(build_dir, 'html')]
+    start = time.perf_counter()
+    os.chdir(course)
+    with open(log_path, 'w', encoding='utf-8') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            status = build_main(argv)
+        except BaseException as error:
+            print('Build raised {!r}'.format(error))
+            status = 1
+    elapsed = time.perf_counter() - start
+    try:
+        with open(warnings_path, encoding='utf-8') as f:
+            warnings = sum(1 for line in f if 'WARNING:' in line or 'ERROR:' in line)
+    except OSError:
+        warnings = 0
+    return {
+        'course': course,
+        'status': 'ok' if status == 0 else 'failed',
+        'time': round(elapsed, 3),
+        'warnings': warnings,
+        'log': log_path,
+    }
+
+
+def read_history(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_history(path, history, results):
+    for result in results:
+        if result['status'] == 'ok':
+            history[result['course']] = result['time']
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2, sort_keys=True)
+
+
+def build_order(courses, history):
+    ''' Orders the courses by the previous build time, the longest first.
+    The courses without a previous time come first. '''
+    return sorted(courses, key=lambda course: -history.get(course, float('inf')))
+
+
+def run(courses, workers, clean, history):
+    with_tools = [course for course in courses if own_tools(course)]
+    if with_tools:
+        print('Not preloading the extensions, {:d} courses have their own a-plus-rst-tools.'.format(
+            len(with_tools)), flush=True)
+    preload(extensions=not with_tools)
+    context = multiprocessing.get_context('fork')
+    tasks = [(course, clean) for course in build_order(courses, history)]
+    results = []
+    # A new worker for each course: fork is cheap after the preload.
+    with context.Pool(workers, maxtasksperchild=1) as pool:
+        for result in pool.imap_unordered(build_course, tasks, chunksize=1):
+            print('{:<8} {:>8.1f} s  {}'.format(result['status'], result['time'], result['course']), flush=True)
+            results.append(result)
+    return results
+
+
+def summary(results, elapsed):
+    lines = ['', '{:<60} {:>9} {:>9} {:>7}'.format('course', 'time (s)', 'warnings', 'status')]
+    for result in sorted(results, key=lambda r: -r['time']):
+        lines.append('{:<60} {:>9.1f} {:>9d} {:>7}'.format(
+            result['course'][-60:], result['time'], result['warnings'], result['status']))
+    failed = [r for r in results if r['status'] != 'ok']
+    lines.append('')
+    lines.append('{:d} courses in {:.1f} s (sum of the build times {:.1f} s), {:d} failed.'.format(
+        len(results), elapsed, sum(r['time'] for r in results), len(failed)))
+    for result in failed:
+        lines.append('See {}'.format(result['log']))
+    return '\n'.join(lines)
+
+
+def main():
+    p = argparse.ArgumentParser(description='Build many courses in parallel.')
+    p.add_argument('courses', nargs='*', help='course directories')
+    p.add_argument('--file', help='file that lists course directories, one per line')
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+        help='number of parallel builds (default: the CPU count)')
+    p.add_argument('--clean', action='store_true', help='build all the documents again (sphinx-build -E)')
+    p.add_argument('--history', default=DEFAULT_HISTORY, help='file of the previous build times')
+    p.add_argument('--report', help='write the results into this JSON file')
+    args = p.parse_args()
+
+    courses = list(args.courses)
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            courses += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    courses = list(dict.fromkeys(os.path.abspath(course) for course in courses))
+    missing = [course for course in courses if not os.path.isfile(os.path.join(course, 'conf.py'))]
+    if missing:
+        p.error('No conf.py in: {}'.format(', '.join(missing)))
+    if not courses:
+        p.error('No courses to build.')
+
+    history = read_history(args.history)
+    start = time.perf_counter()
+    results = run(courses, max(1, args.workers), args.clean, history)
+    elapsed = time.perf_counter() - start
+    write_history(args.history, history, results)
+    print(summary(results, elapsed))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'time': round(elapsed, 3), 'courses': results}, f, indent=2)
+    return 0 if all(r['status'] == 'ok' for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+'''
+Checks that annotate() of directives/annotated.py gives the same output as
+its earlier implementation, which split the highlighted code into single
+characters.
+
+A corpus of random code blocks is highlighted with Pygments (Python, Scala
+and C, with HTML entities and emphasized lines) and annotated with random
+ranges that span up to three lines. The corpus is generated from a fixed
+seed, so the same blocks are checked on every run. The script exits with
+status 1 and prints the first differing block if the outputs differ. Run it
+after changing the annotation logic.
+
+Examples:
+
+    python3 benchmarks/annotate_equivalence.py
+    python3 benchmarks/annotate_equivalence.py --count 10000 --seed 7
+'''
+import argparse
+import os
+import random
+import re
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, 'directives'))
+
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import CLexer, PythonLexer, ScalaLexer
+
+from annotated import annotate, create_close_tag, create_open_tag, turn_to_close_tag
+
+
+LEXERS = [PythonLexer(), ScalaLexer(), CLexer()]
+TOKENS = [
+    'def', 'val', 'int', 'return', 'if', 'x', 'value', 'foo_bar', '42', '3.14',
+    '"text"', "'c'", '"a & b"', '"<tag>"', '&&', '||', '<', '>', '<=', '->',
+    '=', '+', '(', ')', '{', '}', '[', ']', ',', ':', ';', '.', '#', '//',
+    '/* c */', '# comment', '"', ' ', ' ', ' ', '  ', '\t',
+]
+
+
+def reference_annotate(html, section_name, annotations):
+    ''' The implementation of annotate() before the boundaries were bisected. '''
+    annotations = sorted(annotations, key = lambda x:x[3:5], reverse=True)
+
+    startpoint_map = defaultdict(list)
+    endpoint_map   = defaultdict(list)
+    for a in annotations:
+        number= a[0]
+        start = a[1:3]
+        end   = a[3:5]
+        startpoint_map[start].append(number)
+        endpoint_map[end].append(number)
+
+    html = html.replace("<span></span>", "")
+    parts = re.split('(<pre.*?>|</pre>)', html)
+    original = re.split('(<.*?>|\n)', parts[2])
+
+    line = 0
+    loc  = 0
+    result = []
+    last_open  = ''
+    for item in original:
+        if '</' in item:
+            result.append(item)
+            last_open = ''
+            for number in endpoint_map[(line, loc)]:
+                result.append(create_close_tag(number, section_name))
+        elif '<' in item:
+            for number in startpoint_map[(line, loc)]:
+                result.append(create_open_tag(number, section_name))
+            last_open = item
+            result.append(item)
+        elif '\n' in item:
+            line += 1
+            loc   = 0
+            result.append(item)
+        elif item:
+            chars = re.findall(r'(&#?\w+;?|.)', item)
+            start_loc = loc
+            end_loc   = loc + len(chars)
+            if (not last_open):
+                for number in startpoint_map[(line, loc)]:
+                    result.append(create_open_tag(number, section_name))
+            for char in chars:
+                if (loc != start_loc) & (loc != end_loc) & (((line, loc) in endpoint_map) | ((line, loc) in startpoint_map)):
+                    if last_open:
+                        result.append(turn_to_close_tag(last_open))
+                    for number in endpoint_map[(line, loc)]:
+                       result.append(create_close_tag(number, section_name))
+                    for number in startpoint_map[(line, loc)]:
+                       result.append(create_open_tag(number, section_name))
+                    if last_open:
+                        result.append(last_open)
+                result.append(char)
+                loc += 1
+            if (not last_open):
+                for number in endpoint_map[(line, loc)]:
+                    result.append(create_close_tag(number, section_name))
+
+    content = ''.join(result)
+    return ''.join([parts[0], parts[1], content, parts[3], parts[4]])
+
+
+def random_block(rng):
+    ''' Returns the highlighted HTML and the annotations of a random block. '''
+    lines = [
+        ''.join(rng.choice(TOKENS) for _ in range(rng.randint(0, 12)))
+        for _ in range(rng.randint(1, 8))
+    ]
+    emphasized = [i + 1 for i in range(len(lines)) if rng.random() < 0.2]
+    html = highlight('\n'.join(lines) + '\n', rng.choice(LEXERS), HtmlFormatter(hl_lines=emphasized))
+
+    annotations = []
+    # The ranges may also overlap, which annotate() must handle the same way.
+    for number in range(1, rng.randint(1, 6)):
+        start_line = rng.randrange(len(lines))
+        end_line = rng.randint(start_line, min(len(lines) - 1, start_line + 2))
+        start = rng.randint(0, len(lines[start_line]))
+        end = rng.randint(start if end_line == start_line else 0, len(lines[end_line]))
+        annotations.append((number, start_line, start, end_line, end))
+    return html, annotations
+
+
+def main():
+    p = argparse.ArgumentParser(description='Compare annotate() with its earlier implementation.')
+    p.add_argument('--count', type=int, default=3000, help='number of random blocks (default 3000)')
+    p.add_argument('--seed', type=int, default=1, help='seed of the corpus (default 1)')
+    args = p.parse_args()
+
+    rng = random.Random(args.seed)
+    for i in range(args.count):
+        html, annotations = random_block(rng)
+        expected = reference_annotate(html, 'section', annotations)
+        actual = annotate(html, 'section', annotations)
+        if actual != expected:
+            print('Block {:d} differs.\nAnnotations: {!r}\nInput:\n{}\nExpected:\n{}\nActual:\n{}'.format(
+                i, annotations, html, expected, actual))
+            return 1
+    print('{:d} blocks, identical output.'.format(args.count))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+'''
+Generates a synthetic course for benchmarking the build.
+
+The course contains the given number of modules and chapters. Each chapter
+has questionnaires, submit exercises with config YAML files, points of
+interest and annotated code blocks. A multilingual course with a language
+tree is generated when more than one language is given.
+
+Example:
+
+    python3 benchmarks/generate_course.py /tmp/bench-course --modules 5 --chapters 8
+
+The course is built with the a-plus-rst-tools of this repository.
+'''
+import argparse
+import os
+import shutil
+
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONF = '''\
+import os
+import sys
+
+sys.path.append({tools!r})
+sys.path.append(os.path.join({tools!r}, 'directives'))
+
+project = 'Synthetic course'
+master_doc = 'index'
+language = {language!r}
+exclude_patterns = ['_build']
+
+extensions = [
+    'aplus_setup',
+    'annotated',
+    'point_of_interest',
+]
+
+course_open_date = '2021-01-01'
+course_close_date = '2021-12-31'
+questionnaire_default_submissions = 5
+program_default_submissions = 10
+
+html_theme = 'aplus'
+html_theme_path = [os.path.join({tools!r}, 'theme')]
+html_theme_options = {{
+    'use_wide_column': True,
+}}
+html_static_path = []
+'''
+
+EXERCISE_CONFIG = '''\
+title: Exercise {key}
+instructions: |
+  <p>Write a function that returns the sum of two numbers.</p>
+view_type: access.types.stdasync.acceptFiles
+files:
+  - field: file1
+    name: functions.py
+container:
+  image: apluslms/grade-python:3.9-4.4-4.0
+  mount: exercises/{key}
+  cmd: /exercise/run.sh
+'''
+
+
+def chapter_text(language, module, chapter, options):
+    title = 'Chapter {}.{}'.format(module, chapter)
+    if language:
+        title += ' ({})'.format(language)
+    lines = [title, '=' * len(title), '']
+    prefix = 'm{:02d}c{:02d}'.format(module, chapter)
+    for n in range(1, max(options.questionnaires, options.exercises, options.pois, options.annotated) + 1):
+        lines += [
+            'Section {}'.format(n),
+            '-' * (len(str(n)) + 8),
+            '',
+            'Lorem ipsum dolor sit amet, consectetur adipiscing elit. Vivamus',
+            'hendrerit auctor quam at maximus. Phasellus ornare *suscipit*',
+            'tortor et aliquet. See :doc:`/index` and ``code``.',
+            '',
+        ]
+        if n <= options.pois:
+            lines += [
+                '.. point-of-interest:: Point {}'.format(n),
+                '  :id: {}-poi{:02d}'.format(prefix, n),
+                '',
+                '  Content of the point of interest with **markup**.',
+                '',
+            ]
+        if n <= options.annotated:
+            lines += [
+                '.. annotated::',
+                '',
+                '  .. code-block:: python',
+                '',
+                '    1«def add(a, b):»',
+                '        2«return a + b»',
+                '',
+                '    3«print(add(1, 2))»',
+                '',
+                '  .. annotation::',
+                '',
+                '    Definition.',
+                '',
+                '  .. annotation::',
+                '',
+                '    Return.',
+                '',
+                '  .. annotation::',
+                '',
+                '    Call.',
+                '',
+            ]
+        if n <= options.questionnaires:
+            lines += [
+                '.. questionnaire:: {}q{:02d} A'.format(prefix, n),
+                '  :submissions: 4',
+                '',
+                '  Answer the questions.',
+                '',
+            ]
+            for q in range(1, options.questions + 1):
+                lines += [
+                    '  .. pick-one:: 10',
+                    '',
+                    '    What is {} + 1?'.format(q),
+                    '',
+                    '    a. {}'.format(q),
+                    '    *b. {}'.format(q + 1),
+                    '    c. {}'.format(q + 2),
+                    '',
+                    '    a § Count again!',
+                    '    b § Correct!',
+                    '',
+                ]
+        if n <= options.exercises:
+            key = '{}e{:02d}'.format(prefix, n)
+            lines += [
+                '.. submit:: {} 10'.format(key),
+                '  :config: exercises/{}/config.yaml'.format(key),
+                '',
+            ]
+    return '\n'.join(lines) + '\n'
+
+
+def toctree(entries, caption=None, hidden=False):
+    lines = ['.. toctree::', '  :maxdepth: 1']
+    if caption:
+        lines.append('  :caption: ' + caption)
+    if hidden:
+        lines.append('  :hidden:')
+    lines.append('')
+    lines.extend('  ' + entry for entry in entries)
+    return '\n'.join(lines) + '\n'
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def generate(output, options):
+    ''' Writes the course into the output directory. Returns the path of
+    the chapter that the benchmarks edit. '''
+    if os.path.exists(output):
+        shutil.rmtree(output)
+    languages = options.languages
+    multilingual = len(languages) > 1
+    write(os.path.join(output, 'conf.py'), CONF.format(tools=TOOLS_DIR, language=languages[0]))
+
+    meta = ':course-start: 2021-01-01 12:00\n:course-end: 2021-12-31 12:00\n\n'
+    modules = ['module{:02d}'.format(m) for m in range(1, options.modules + 1)]
+    for language in languages:
+        suffix = '_' + language if multilingual else ''
+        course_index = 'index' + suffix
+        title = 'Synthetic course'
+        write(
+            os.path.join(output, course_index + '.rst'),
+            (meta if not multilingual else '') + title + '\n' + '=' * len(title) + '\n\n'
+            + toctree(['{}/index{}'.format(module, suffix) for module in modules]),
+        )
+        for m, module in enumerate(modules, 1):
+            title = 'Module {}'.format(m)
+            write(
+                os.path.join(output, module, 'index{}.rst'.format(suffix)),
+                title + '\n' + '=' * len(title) + '\n\n'
+                + toctree(['chapter{:02d}{}'.format(c, suffix) for c in range(1, options.chapters + 1)]),
+            )
+            for c in range(1, options.chapters + 1):
+                write(
+                    os.path.join(output, module, 'chapter{:02d}{}.rst'.format(c, suffix)),
+                    chapter_text(language if multilingual else None, m, c, options),
+                )
+    if multilingual:
+        write(
+            os.path.join(output, 'index.rst'),
+            meta + 'Synthetic course\n================\n\n'
+            + toctree(['index_' + language for language in languages], caption='Select language'),
+        )
+
+    for m in range(1, options.modules + 1):
+        for c in range(1, options.chapters + 1):
+            for n in range(1, options.exercises + 1):
+                key = 'm{:02d}c{:02d}e{:02d}'.format(m, c, n)
+                write(os.path.join(output, 'exercises', key, 'config.yaml'), EXERCISE_CONFIG.format(key=key))
+
+    suffix = '_' + languages[0] if multilingual else ''
+    return os.path.join(output, modules[0], 'chapter01{}.rst'.format(suffix))
+
+
+def parser():
+    p = argparse.ArgumentParser(description='Generate a synthetic A+ course.')
+    p.add_argument('output', help='course directory, removed if it exists')
+    p.add_argument('--modules', type=int, default=3)
+    p.add_argument('--chapters', type=int, default=5, help='chapters per module')
+    p.add_argument('--questionnaires', type=int, default=2, help='questionnaires per chapter')
+    p.add_argument('--questions', type=int, default=5, help='questions per questionnaire')
+    p.add_argument('--exercises', type=int, default=2, help='submit exercises per chapter')
+    p.add_argument('--pois', type=int, default=2, help='points of interest per chapter')
+    p.add_argument('--annotated', type=int, default=2, help='annotated code blocks per chapter')
+    p.add_argument('--languages', default='en',
+        type=lambda value: [v.strip() for v in value.split(',') if v.strip()],
+        help='comma-separated language codes, e.g., en,fi for a multilingual course')
+    return p
+
+
+if __name__ == '__main__':
+    args = parser().parse_args()
+    generate(args.output, args)
+    print('Generated the course into {}'.format(args.output))
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+'''
+Microbenchmarks for the pure-Python functions that dominate the build time
+of large courses. They run without Sphinx building anything.
+
+Every function is timed with generated inputs of growing size. The inputs
+grow linearly, so the time of the functions should also grow linearly.
+The growth exponent is fitted to the times of the sizes
+(time ~ size ** exponent), and the script exits with status 1 if any
+exponent exceeds the limit. A quadratic algorithm has an exponent near 2.
+
+Examples:
+
+    python3 benchmarks/microbenchmarks.py
+    python3 benchmarks/microbenchmarks.py --only annotate --sizes 200,400,800,1600
+'''
+import argparse
+import copy
+import gc
+import math
+import os
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(1, os.path.join(ROOT, 'directives'))
+
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import PythonLexer
+
+import aplus_nodes
+import lib.html_tools as html_tools
+import lib.toc_languages as toc_languages
+from annotated import annotate
+from lib.revealrule import parse_reveal_rule
+
+
+BUILD_ROOT = os.path.join(os.sep, 'course', '_build', 'html')
+CHAPTER_DIRS = ['module{:02d}'.format(i) for i in range(1, 11)] + ['toc', 'user', 'account']
+PARAGRAPH = (
+    '<p>Lorem ipsum dolor sit amet, <em>consectetur</em> adipiscing elit. '
+    '<a href="../module02/chapter03.html#section">Link</a> and '
+    '<a href="https://example.com/page">external</a>.</p>\n'
+    '<img alt="figure" src="../_images/figure{0}.png" />\n'
+    '<a class="reference download" href="../_downloads/abc/file{0}.py">file</a>\n'
+)
+REVEAL_RULES = [
+    'immediate', 'manual', 'completion', 'time 2021-06-01 12:00',
+    'deadline', 'deadline +2d', 'deadline_all + 12 h', 'deadline_or_full_points',
+]
+
+
+# Inputs: each setup function returns the arguments of one call.
+
+def setup_rewrite_links(n):
+    content = ''.join(PARAGRAPH.format(i) for i in range(n))
+    path = os.path.join(BUILD_ROOT, 'module01', 'chapter01.html')
+    return (content, path, BUILD_ROOT, [('a', 'href')],
+        [('img', 'src'), ('script', 'src'), ('iframe', 'src'), ('link', 'href')],
+        None, CHAPTER_DIRS, 'data-aplus-chapter ', 'data-aplus-path="/static/{course}" ')
+
+
+def setup_recursive_rewrite_links(n):
+    data = {
+        'title': 'Exercise',
+        'instructions': ''.join(PARAGRAPH.format(i) for i in range(3)),
+        'form': [
+            {'key': 'field{}'.format(i), 'title': 'Question {}'.format(i),
+             'more': PARAGRAPH.format(i), 'options': [{'label': 'a'}, {'label': 'b'}]}
+            for i in range(n)
+        ],
+    }
+    path = os.path.join(os.path.dirname(BUILD_ROOT), 'yaml', 'module01_chapter01_q1.yaml')
+    return (data, path, BUILD_ROOT, [('a', 'href')], [('img', 'src')], None,
+        CHAPTER_DIRS, 'data-aplus-chapter ', 'data-aplus-path="/static/{course}" ',
+        'module01/chapter01.rst')
+
+
+def setup_annotate(n):
+    code = ''.join(
+        'def function_{0}(value, other="text & <more>"):\n'
+        '    return value + {0}  # comment\n'.format(i)
+        for i in range(n)
+    )
+    html = '<div class="highlight">' + highlight(code, PythonLexer(), HtmlFormatter(nowrap=True)) + '</div>'
+    html = html.replace('<div class="highlight">', '<div class="highlight"><pre>', 1).replace('</div>', '</pre></div>')
+    annotations = [(i + 1, 2 * i, 4, 2 * i + 1, 12) for i in range(n)]
+    return html, 'section', annotations
+
+
+def make_index(lang, n):
+    def child(m, c):
+        return {
+            'key': 'chapter{:02d}_{}'.format(c, lang),
+            'name': 'Chapter {} ({})'.format(c, lang),
+            'static_content': 'module{:02d}/chapter{:02d}_{}.html'.format(m, c, lang),
+            'category': 'chapter',
+            'children': [
+                {'key': 'm{}c{}q{}'.format(m, c, q), 'category': 'questionnaire',
+                 'max_points': 10, 'title': 'Questionnaire {} ({})'.format(q, lang)}
+                for q in range(3)
+            ],
+        }
+    return {
+        'lang': lang,
+        'name': 'Course ({})'.format(lang),
+        'categories': {'chapter': {'name': 'Chapters'}, 'questionnaire': {'name': 'Questionnaires'}},
+        'modules': [
+            {'key': 'module{:02d}'.format(m), 'name': 'Module {} ({})'.format(m, lang),
+             'children': [child(m, c) for c in range(5)]}
+            for m in range(n)
+        ],
+    }
+
+
+def setup_index_joiner(n):
+    config = types.SimpleNamespace(skip_language_inconsistencies=False, override={})
+    app = types.SimpleNamespace(config=config, env=types.SimpleNamespace(config=config))
+    return toc_languages.IndexJoiner(app, 'en', make_index('en', n)), 'fi', make_index('fi', n)
+
+
+def setup_deep_equals(n):
+    data = make_index('en', n)
+    return data, copy.deepcopy(data)
+
+
+def setup_key_without_language(n):
+    return 'fi', '_'.join('part{}_fi'.format(i) for i in range(n))
+
+
+def setup_collect_data(n):
+    # Rendered node tree of a questionnaire with n questions.
+    body = ['<div class="questionnaire">']
+    node = aplus_nodes.html('div', {})
+    node._body_begin = 0
+    node._body_children_begin = 1
+    for i in range(n):
+        child = aplus_nodes.html('div', {})
+        child.set_yaml({
+            'key': 'field{}'.format(i),
+            'title': ('#!html', 'title'),
+            'options': [{'label': ('#!html', 'label')}],
+        }, 'question')
+        child._body_begin = len(body)
+        body.append('<p>Question {}</p>'.format(i))
+        child._body_end = len(body)
+        node.append(child)
+        body.append('<p>Static text between the questions.</p>')
+    node._body_children_end = len(body)
+    body.append('</div>')
+    node._body_end = len(body)
+    data = {'fieldgroups': [{'fields': ('#!children', None)}]}
+    return body, data, node
+
+
+def setup_parse_reveal_rules(n):
+    return ([REVEAL_RULES[i % len(REVEAL_RULES)] for i in range(n)],)
+
+
+def run_rewrite_links(*args):
+    html_tools.rewrite_links(*args)
+
+
+def run_recursive_rewrite_links(*args):
+    html_tools.recursive_rewrite_links(*args)
+
+
+def run_index_joiner(joiner, lang, index):
+    joiner.join(lang, index)
+
+
+def run_parse_reveal_rules(rules):
+    for rule in rules:
+        parse_reveal_rule(rule, 'chapter.rst', 1, 'reveal-submission-feedback')
+
+
+# name: (setup, function, default sizes)
+BENCHMARKS = {
+    'rewrite_links': (setup_rewrite_links, run_rewrite_links, (250, 500, 1000, 2000)),
+    'recursive_rewrite_links': (setup_recursive_rewrite_links, run_recursive_rewrite_links, (100, 200, 400, 800)),
+    'annotate': (setup_annotate, annotate, (250, 500, 1000, 2000)),
+    'IndexJoiner.join': (setup_index_joiner, run_index_joiner, (20, 40, 80, 160)),
+    'deep_equals': (setup_deep_equals, toc_languages.deep_equals, (50, 100, 200, 400)),
+    'key_without_language': (setup_key_without_language, toc_languages.key_without_language, (500, 1000, 2000, 4000)),
+    'collect_data/recursive_fill': (setup_collect_data, aplus_nodes.recursive_fill, (250, 500, 1000, 2000)),
+    'parse_reveal_rule': (setup_parse_reveal_rules, run_parse_reveal_rules, (1000, 2000, 4000, 8000)),
+}
+
+
+def measure(setup, function, size, repeat):
+    ''' Returns the best time of one call. Each call gets fresh arguments
+    because some of the functions modify their input. '''
+    # The garbage collector is disabled like in timeit because its pauses
+    # depend on the number of objects alive rather than on the function.
+    gc.disable()
+    try:
+        return _measure(setup, function, size, repeat)
+    finally:
+        gc.enable()
+
+
+def _measure(setup, function, size, repeat):
+    # Calibrate the number of calls per round to get measurable times.
+    number = 1
+    while True:
+        args = [setup(size) for _ in range(number)]
+        start = time.perf_counter()
+        for a in args:
+            function(*a)
+        elapsed = time.perf_counter() - start
+        if elapsed >= 0.05 or number >= 1000:
+            break
+        number *= 4
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        args = [setup(size) for _ in range(number)]
+        start = time.perf_counter()
+        for a in args:
+            function(*a)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def growth_exponent(sizes, times):
+    ''' Least squares slope of log(time) against log(size). '''
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(t) for t in times]
+    mx = sum(xs) / len(xs)
+    my = sum(ys) / len(ys)
+    return (sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+        / sum((x - mx) ** 2 for x in xs))
+
+
+def main():
+    p = argparse.ArgumentParser(description='Run the microbenchmarks.')
+    p.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+        help='benchmark to run, may be repeated (default: all)')
+    p.add_argument('--sizes', type=lambda value: tuple(int(v) for v in value.split(',')),
+        help='comma-separated input sizes instead of the defaults')
+    p.add_argument('--repeat', type=int, default=5, help='rounds per size, the best is reported')
+    p.add_argument('--max-exponent', type=float, default=1.3,
+        help='largest accepted growth exponent (default 1.3)')
+    args = p.parse_args()
+
+    failures = []
+    for name in args.only or BENCHMARKS:
+        setup, function, sizes = BENCHMARKS[name]
+        sizes = args.sizes or sizes
+        times = [measure(setup, function, size, args.repeat) for size in sizes]
+        exponent = growth_exponent(sizes, times)
+        status = 'ok'
+        if exponent > args.max_exponent:
+            status = 'SUPERLINEAR'
+            failures.append(name)
+        print('{:<28} {}  exponent {:.2f} {}'.format(
+            name,
+            '  '.join('{:>6d}: {:8.3f} ms'.format(size, t * 1000) for size, t in zip(sizes, times)),
+            exponent, status,
+        ), flush=True)
+
+    if failures:
+        print('Superlinear growth: {}'.format(', '.join(failures)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+'''
+End-to-end build benchmarks for synthetic courses.
+
+Each course preset is generated with generate_course.py and built with
+sphinx-build in three scenarios:
+
+* full: a clean build,
+* noop: a rebuild without changes,
+* edit: a rebuild after one chapter has been edited.
+
+The builds run with the build profiler (lib/profiler.py), so the times of
+the post-processing stages (toc_config.write, toc_languages.join,
+html_tools.rewrite_outdir, ...) are recorded together with the total time.
+The median of the repeated runs is compared against the baseline file and
+the script exits with status 1 if a time is slower than the baseline by
+more than the tolerance.
+
+Examples:
+
+    python3 benchmarks/run_benchmarks.py --save-baseline
+    python3 benchmarks/run_benchmarks.py --preset small --repeat 5
+'''
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import generate_course
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+PRESETS = {
+    'small': dict(modules=2, chapters=4, questionnaires=1, questions=5,
+        exercises=1, pois=1, annotated=1, languages=['en']),
+    'medium': dict(modules=6, chapters=8, questionnaires=2, questions=8,
+        exercises=2, pois=2, annotated=2, languages=['en']),
+    'multilingual': dict(modules=4, chapters=6, questionnaires=2, questions=5,
+        exercises=2, pois=1, annotated=1, languages=['en', 'fi']),
+}
+SCENARIOS = ('full', 'noop', 'edit')
+
+# Times below this many seconds are not compared because they are noise.
+MIN_COMPARED_TIME = 0.05
+
+
+def build(course_dir, jobs):
+    ''' Builds the course and returns the total time and the profiled phases. '''
+    env = dict(os.environ, APLUS_BUILD_PROFILE='1')
+    command = [sys.executable, '-m', 'sphinx', '-q', '-b', 'html', '-j', str(jobs),
+        course_dir, os.path.join(course_dir, '_build', 'html')]
+    start = time.perf_counter()
+    result = subprocess.run(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True)
+    total = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError('The build failed:\n' + result.stdout)
+    with open(os.path.join(course_dir, '_build', 'profile.json'), encoding='utf-8') as f:
+        profile = json.load(f)
+    times = {'total': total}
+    for name, entry in profile['phases'].items():
+        times[name] = entry['wall']
+    times['directives'] = sum(entry['self_wall'] for entry in profile['directives'].values())
+    return times
+
+
+def edit(path):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('\nEdited paragraph {}.\n'.format(time.time()))
+
+
+def run_preset(name, options, repeat, jobs, work_dir):
+    runs = {scenario: [] for scenario in SCENARIOS}
+    course_dir = os.path.join(work_dir, name)
+    for _ in range(repeat):
+        edited = generate_course.generate(course_dir, argparse.Namespace(**options))
+        runs['full'].append(build(course_dir, jobs))
+        runs['noop'].append(build(course_dir, jobs))
+        edit(edited)
+        runs['edit'].append(build(course_dir, jobs))
+    return {scenario: medians(results) for scenario, results in runs.items()}
+
+
+def medians(results):
+    names = set().union(*results)
+    return {
+        name: round(statistics.median(r.get(name, 0.0) for r in results), 4)
+        for name in sorted(names)
+    }
+
+
+def compare(results, baseline, tolerance):
+    ''' Prints the comparison table and returns the regressions. '''
+    regressions = []
+    print('{:<52} {:>10} {:>10} {:>8}'.format('', 'baseline', 'current', 'change'))
+    for preset, scenarios in sorted(results.items()):
+        for scenario in SCENARIOS:
+            for name, current in scenarios[scenario].items():
+                label = '{}/{}/{}'.format(preset, scenario, name)
+                base = baseline.get(preset, {}).get(scenario, {}).get(name)
+                if base is None:
+                    print('{:<52} {:>10} {:>10.3f}'.format(label, '-', current))
+                    continue
+                change = (current - base) / base if base else 0.0
+                flag = ''
+                if max(base, current) >= MIN_COMPARED_TIME and change > tolerance:
+                    flag = ' SLOWER'
+                    regressions.append(label)
+                print('{:<52} {:>10.3f} {:>10.3f} {:>+7.0%}{}'.format(label, base, current, change, flag))
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description='Benchmark the course build.')
+    p.add_argument('--preset', action='append', choices=sorted(PRESETS),
+        help='course preset to benchmark, may be repeated (default: all)')
+    p.add_argument('--repeat', type=int, default=3, help='runs per scenario, the median is reported')
+    p.add_argument('--jobs', type=int, default=1, help='sphinx-build -j')
+    p.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    p.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    p.add_argument('--tolerance', type=float, default=0.2,
+        help='allowed slowdown compared to the baseline (default 0.2 = 20 %%)')
+    p.add_argument('--output', help='also write the results into this JSON file')
+    p.add_argument('--keep', action='store_true', help='keep the generated courses')
+    args = p.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='aplus-benchmark-')
+    try:
+        results = {}
+        for name in args.preset or sorted(PRESETS):
+            print('Benchmarking the {} course...'.format(name), flush=True)
+            results[name] = run_preset(name, PRESETS[name], args.repeat, args.jobs, work_dir)
+    finally:
+        if args.keep:
+            print('The generated courses are in {}'.format(work_dir))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print('Saved the baseline into {}'.format(args.baseline))
+    elif regressions:
+        print('{:d} times are slower than the baseline by more than {:.0%}.'.format(
+            len(regressions), args.tolerance))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+'''
+Build server: keeps the Sphinx applications of courses in memory and builds
+the courses on request.
+
+A build with sphinx-build spends a large part of its time on starting Python,
+importing Sphinx and the extensions and loading the pickled environment
+before it reads any changed document. The server does this once per course.
+The following builds of the course are incremental builds of the same
+application, like in the watch mode (watch.py).
+
+The server listens on a Unix socket. A request is one line of JSON and so is
+the response:
+
+    {"command": "build", "course": "/path/to/course", "clean": false}
+    {"status": "ok", "time": 0.42, "warnings": [...], "changed": [...], "removed": [...]}
+
+The changed and removed files are relative to the _build directory of the
+course. The status is "ok", "failed" (the build had errors) or "error"
+(the request could not be handled). The other commands are "drop", which
+forgets the application of a course, and "stop", which stops the server.
+
+The application of a course is created again if its conf.py changes or a
+build raises an exception. The builds run one at a time because Sphinx and
+docutils keep global state. All the courses are built with the tools that
+the server imported first, so they should use the same version of the tools.
+The directives, roles and nodes that the extensions of a course register in
+docutils are active only while the course is created or built, so they do not
+leak into the other courses.
+
+Examples:
+
+    python3 a-plus-rst-tools/build_server.py serve
+    python3 a-plus-rst-tools/build_server.py build /path/to/course
+'''
+import argparse
+import collections
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+from watch import output_files
+
+
+def default_socket():
+    directory = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(directory, 'aplus-build-{:d}.sock'.format(os.getuid()))
+
+
+class WarningStream:
+    ''' Collects the warnings of the current build. '''
+
+    def __init__(self):
+        self.lines = []
+
+    def write(self, text):
+        self.lines.extend(line for line in text.splitlines() if line.strip())
+
+    def flush(self):
+        pass
+
+
+class NullStream:
+    ''' Discards the status messages of the builds. '''
+
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+class Course:
+    ''' The Sphinx application of a course. '''
+
+    def __init__(self, path, jobs, fresh):
+        from sphinx.application import Sphinx
+        self.path = path
+        self.build_dir = os.path.join(path, '_build')
+        self.conf_mtime = os.stat(os.path.join(path, 'conf.py')).st_mtime_ns
+        self.status = NullStream()
+        self.warnings = WarningStream()
+        self.registrations = None
+        with self.docutils_namespace():
+            self.app = Sphinx(
+                path, path, os.path.join(self.build_dir, 'html'),
+                os.path.join(self.build_dir, 'doctrees'), 'html',
+                status=self.status, warning=self.warnings, freshenv=fresh, parallel=jobs,
+            )
+
+    @contextlib.contextmanager
+    def docutils_namespace(self):
+        ''' Activates the docutils registrations of the course, like
+        sphinx-build does for its single application. '''
+        from docutils.parsers.rst import directives, roles
+        from sphinx.util.docutils import (additional_nodes, docutils_namespace,
+            patch_docutils, register_node)
+        with patch_docutils(self.path), docutils_namespace():
+            if self.registrations is not None:
+                course_directives, course_roles, course_nodes = self.registrations
+                directives._directives = dict(course_directives)
+                roles._roles = dict(course_roles)
+                for node in course_nodes:
+                    register_node(node)
+            yield
+            self.registrations = (dict(directives._directives), dict(roles._roles), set(additional_nodes))
+
+    def is_current(self):
+        try:
+            return os.stat(os.path.join(self.path, 'conf.py')).st_mtime_ns == self.conf_mtime
+        except OSError:
+            return False
+
+    def build(self):
+        from sphinx.util import logging
+        # The logging handlers of Sphinx are global and write to the streams
+        # of the application that was created last.
+        logging.setup(self.app, self.status, self.warnings)
+        self.warnings.lines = []
+        before = output_files(self.app)
+        start = time.perf_counter()
+        with self.docutils_namespace():
+            self.app.build()
+        elapsed = time.perf_counter() - start
+        after = output_files(self.app)
+        return {
+            'status': 'failed' if self.app.statuscode else 'ok',
+            'time': round(elapsed, 3),
+            'warnings': self.warnings.lines,
+            'changed': sorted(self.relative(p) for p, mtime in after.items() if before.get(p) != mtime),
+            'removed': sorted(self.relative(p) for p in before if p not in after),
+        }
+
+    def relative(self, path):
+        return os.path.relpath(path, self.build_dir).replace(os.sep, '/')
+
+
+class BuildServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, max_courses, jobs):
+        super().__init__(path, RequestHandler)
+        self.courses = collections.OrderedDict()
+        self.max_courses = max_courses
+        self.jobs = jobs
+        self.lock = threading.Lock()
+
+    def build(self, path, clean=False):
+        path = os.path.abspath(path)
+        if not os.path.isfile(os.path.join(path, 'conf.py')):
+            return {'status': 'error', 'error': 'No conf.py in {}'.format(path)}
+        with self.lock:
+            course = self.courses.pop(path, None)
+            if course is None or clean or not course.is_current():
+                # The working directory is the course directory like in
+                # sphinx-build, because some settings use relative paths.
+                os.chdir(path)
+                course = Course(path, self.jobs, clean)
+            os.chdir(path)
+            try:
+                result = course.build()
+            except Exception:
+                # The application may be in an inconsistent state.
+                return {'status': 'error', 'error': traceback.format_exc(),
+                    'warnings': course.warnings.lines}
+            # The least recently built courses are dropped first.
+            self.courses[path] = course
+            while len(self.courses) > self.max_courses:
+                self.courses.popitem(last=False)
+            return result
+
+    def drop(self, path):
+        with self.lock:
+            found = self.courses.pop(os.path.abspath(path), None) is not None
+        return {'status': 'ok', 'dropped': found}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                command = request.get('command', 'build')
+                if command == 'build':
+                    response = self.server.build(request['course'], request.get('clean', False))
+                elif command == 'drop':
+                    response = self.server.drop(request['course'])
+                elif command == 'stop':
+                    response = {'status': 'ok'}
+                    threading.Thread(target=self.server.shutdown).start()
+                else:
+                    response = {'status': 'error', 'error': 'Unknown command: {}'.format(command)}
+            except Exception:
+                response = {'status': 'error', 'error': traceback.format_exc()}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+def serve(args):
+    from sphinx.util.console import nocolor
+    # The warnings are sent to the clients without the terminal colors.
+    nocolor()
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    server = BuildServer(args.socket, args.max_courses, args.jobs)
+    os.chmod(args.socket, 0o600)
+    print('Listening on {}'.format(args.socket), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+    return 0
+
+
+def request(socket_path, data):
+    ''' Sends a request to the server and returns the response. '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        s.sendall(json.dumps(data).encode('utf-8') + b'\n')
+        with s.makefile('rb') as f:
+            return json.loads(f.readline().decode('utf-8'))
+
+
+def client(args):
+    data = {'command': args.command}
+    if args.command != 'stop':
+        data['course'] = os.path.abspath(args.course)
+    if args.command == 'build':
+        data['clean'] = args.clean
+    response = request(args.socket, data)
+    if args.json:
+        print(json.dumps(response, indent=2))
+    else:
+        for line in response.get('warnings', []):
+            print(line, file=sys.stderr)
+        if 'error' in response:
+            print(response['error'], file=sys.stderr)
+        if 'time' in response:
+            print('Build {} in {:.2f} s, {:d} files changed, {:d} removed.'.format(
+                'succeeded' if response['status'] == 'ok' else 'failed',
+                response['time'], len(response['changed']), len(response['removed'])))
+    return 0 if response['status'] == 'ok' else 1
+
+
+def main():
+    p = argparse.ArgumentParser(description='Build courses with a persistent build server.')
+    p.add_argument('--socket', default=default_socket(), help='path of the Unix socket')
+    commands = p.add_subparsers(dest='command', required=True)
+    s = commands.add_parser('serve', help='start the server')
+    s.add_argument('--max-courses', type=int, default=8,
+        help='number of courses kept in memory (default 8)')
+    s.add_argument('-j', '--jobs', type=int, default=1, help='parallel jobs of the builds')
+    b = commands.add_parser('build', help='build a course')
+    b.add_argument('course', nargs='?', default='.', help='course directory (default: .)')
+    b.add_argument('--clean', action='store_true', help='build all the documents again')
+    b.add_argument('--json', action='store_true', help='print the response as JSON')
+    d = commands.add_parser('drop', help='forget the application of a course')
+    d.add_argument('course', nargs='?', default='.', help='course directory (default: .)')
+    d.add_argument('--json', action='store_true', help='print the response as JSON')
+    t = commands.add_parser('stop', help='stop the server')
+    t.add_argument('--json', action='store_true', help='print the response as JSON')
+    args = p.parse_args()
+    if args.command == 'serve':
+        return serve(args)
+    return client(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
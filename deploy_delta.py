@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+'''
+Creates and applies delta archives of the build output (see lib/delta.py).
+
+    # Manifest and delta of an existing build directory without building.
+    python3 a-plus-rst-tools/deploy_delta.py make _build deployed/manifest.json
+    # Apply the delta to the deployed copy of the build directory.
+    python3 a-plus-rst-tools/deploy_delta.py apply _build/delta.tar.gz /srv/course/_build
+'''
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'directives'))
+
+import lib.delta as delta
+
+
+def make(args):
+    directories = {'yaml': args.yaml_dir} if args.yaml_dir else None
+    manifest_path = os.path.join(args.build_dir, delta.MANIFEST_NAME)
+    manifest = delta.make_manifest(args.build_dir, delta.read_manifest(manifest_path), directories)
+    delta.write_manifest(manifest_path, manifest)
+    base = delta.read_manifest(args.base) if args.base else None
+    if args.base and base is None:
+        print('{} can not be read, the delta contains all the files.'.format(args.base))
+    changed, removed = delta.compare(base, manifest)
+    output = args.output or os.path.join(args.build_dir, delta.ARCHIVE_NAME)
+    delta.write_archive(output, args.build_dir, base, manifest, changed, removed, directories)
+    print('Wrote {} with {:d} changed and {:d} removed files (of {:d}).'.format(
+        output, len(changed), len(removed), len(manifest['files'])))
+    return 0
+
+
+def apply(args):
+    manifest = delta.read_manifest(os.path.join(args.build_dir, delta.MANIFEST_NAME))
+    result = delta.apply_archive(args.archive, args.build_dir, manifest and manifest['id'], args.force)
+    print('Applied {:d} changed and {:d} removed files.'.format(len(result['changed']), len(result['removed'])))
+    return 0
+
+
+def main():
+    p = argparse.ArgumentParser(description='Delta archives of the course build output.')
+    commands = p.add_subparsers(dest='command', required=True)
+    m = commands.add_parser('make', help='write the manifest and the delta archive of a build directory')
+    m.add_argument('build_dir', help='build directory, e.g., _build')
+    m.add_argument('base', nargs='?', help='manifest of the previous output')
+    m.add_argument('-o', '--output', help='archive path (default: <build_dir>/delta.tar.gz)')
+    m.add_argument('--yaml-dir', help='YAML output directory if yaml_dir is set (default: <build_dir>/yaml)')
+    a = commands.add_parser('apply', help='apply a delta archive to a copy of the previous output')
+    a.add_argument('archive', help='delta archive')
+    a.add_argument('build_dir', help='build directory that the base manifest describes')
+    a.add_argument('--force', action='store_true', help='apply even if the base manifest does not match')
+    args = p.parse_args()
+    try:
+        return make(args) if args.command == 'make' else apply(args)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,9 @@ from urllib.parse import urlparse
 from docutils.parsers.rst import Directive, directives
 from sphinx.errors import SphinxError
 
+import lib.dependencies as dependencies
+import lib.file_hashes as file_hashes
+
 
 def file_mapping(argument):
     """
@@ -109,15 +112,16 @@ class ConfigurableExercise(AbstractExercise):
             return
 
         env = self.state.document.settings.env
-        override = env.config.override
+        override = dependencies.config_value(env, 'override')
         if category in override:
             data.update(override[category])
 
     def set_url(self, data, name):
         env = self.state.document.settings.env
 
-        if "url" not in data and env.config.default_exercise_url:
-            data["url"] = env.config.default_exercise_url
+        default_url = dependencies.config_value(env, 'default_exercise_url')
+        if "url" not in data and default_url:
+            data["url"] = default_url
 
         if "url" in data:
             data["url"] = data["url"].format(key=name)
@@ -131,7 +135,7 @@ class ConfigurableExercise(AbstractExercise):
         elif "configure-url" in self.options:
             url = self.options["configure-url"]
         else:
-            url = self.state.document.settings.env.config.default_configure_url
+            url = dependencies.config_value(self.state.document.settings.env, 'default_configure_url')
 
         if url:
             if exercise_url:
@@ -160,3 +164,6 @@ class ConfigurableExercise(AbstractExercise):
         }
         if url:
             data["configure"]["url"] = url
+        env = self.state.document.settings.env
+        if dependencies.config_value(env, 'configure_file_hashes'):
+            data["configure"]["file_hashes"] = file_hashes.configure_hashes(env.app.srcdir, files, env)
@@ -8,6 +8,8 @@ the configuration value "acos_submit_base_url" (in conf.py). The acos-submit
 directive also automatically uses the "ajax" flag of the submit directive.
 """
 from sphinx.errors import SphinxError
+
+import lib.dependencies as dependencies
 from .submit import SubmitForm
 
 class ACOSSubmitDirective(SubmitForm):
@@ -26,7 +28,7 @@ class ACOSSubmitDirective(SubmitForm):
         self.options['ajax'] = None # flag is active even though it is None in the docutils API
 
         # add the domain to the URL path
-        self.options['url'] = env.config.acos_submit_base_url + self.options['url']
+        self.options['url'] = dependencies.config_value(env, 'acos_submit_base_url') + self.options['url']
 
         # acos exercises don't need configuring
         self.options['no-configure'] = None
@@ -9,6 +9,7 @@ from sphinx.errors import SphinxError
 from sphinx.util import logging
 
 import aplus_nodes
+import lib.dependencies as dependencies
 import lib.translations as translations
 import lib.yaml_writer as yaml_writer
 from directives.abstract_exercise import AbstractExercise
@@ -41,7 +42,7 @@ class ActiveElementInput(AbstractExercise):
         env = self.state.document.settings.env
 
         name = "{}_{}".format(env.docname.replace('/', '_'), key)
-        override = env.config.override
+        override = dependencies.config_value(env, 'override')
 
         classes = []
         if 'class' in self.options:
@@ -93,6 +94,8 @@ class ActiveElementInput(AbstractExercise):
                 os.path.abspath(self.state.document.current_source))
             path = os.path.join(env.app.srcdir, self.options['file'])
             path = utils.relative_path(None, path)
+            # Rebuild the document when the template changes.
+            env.note_dependency(os.path.join(env.app.srcdir, self.options['file']))
             try:
                 raw_file = io.FileInput(source_path=path,
                                         encoding=self.state.document.settings.input_encoding,
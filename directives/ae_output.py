@@ -10,6 +10,7 @@ from docutils import nodes
 from sphinx.errors import SphinxError
 
 import aplus_nodes
+import lib.dependencies as dependencies
 import lib.translations as translations
 import lib.yaml_writer as yaml_writer
 from directives.abstract_exercise import ConfigurableExercise
@@ -38,7 +39,7 @@ class ActiveElementOutput(ConfigurableExercise):
 
         env = self.state.document.settings.env
         name = "{}_{}".format(env.docname.replace('/', '_'), key)
-        override = env.config.override
+        override = dependencies.config_value(env, 'override')
 
         classes = ['exercise']
         if 'class' in self.options:
@@ -91,7 +92,7 @@ class ActiveElementOutput(ConfigurableExercise):
             path = os.path.join(env.app.srcdir, self.options['config'])
             if not os.path.exists(path):
                 raise SphinxError('Missing config path {}'.format(self.options['config']))
-            data = yaml_writer.read(path)
+            data = yaml_writer.read_config(path)
             config_title = data.get('title', None)
 
             env.note_dependency(path) # Add the config file to the rst file's dependencies
@@ -105,10 +106,10 @@ class ActiveElementOutput(ConfigurableExercise):
 
         data.update({
             'key': name,
-            'title': env.config.submit_title.format(
+            'title': dependencies.config_value(env, 'submit_title').format(
                 key_title=key_title, config_title=config_title
             ),
-            'max_submissions': self.options.get('submissions', data.get('max_submissions', env.config.ae_default_submissions)),
+            'max_submissions': self.options.get('submissions', data.get('max_submissions', dependencies.config_value(env, 'ae_default_submissions'))),
         })
 
         if "category" in self.options:
@@ -11,8 +11,10 @@ from sphinx.errors import SphinxError
 from sphinx.util.fileutil import copy_asset
 from sphinx.util import logging
 from operator import itemgetter
+from bisect import bisect_left, bisect_right
 
 import aplus_nodes
+import lib.page_assets as page_assets
 
 CSS_FILE = 'css/annotated.css'
 JS_FILE = 'js/annotated.js'
@@ -21,6 +23,9 @@ assets_path = 'static'
 
 logger = logging.getLogger(__name__)
 
+# The sections of each document: {(docname, idprefix): count}. The counts are
+# cleared when a document is read again, so a rebuild in the same process
+# (watch.py, build_server.py) numbers the sections like a clean build.
 annotated_section_counts = Counter()
 
 class AnnotationError(SphinxError):
@@ -30,11 +35,14 @@ class AnnotationError(SphinxError):
 def clean_path(path):
   return re.sub(r"[/\\ :]+", "", path).replace(".rst", "")
 
-def new_annotated_section_id(source_file_path):
+def new_annotated_section_id(docname, source_file_path):
   idprefix = clean_path(source_file_path).replace(clean_path(os.getcwd()), "")
-  global annotated_section_counts
-  annotated_section_counts[idprefix] += 1
-  return "%s_%s" % (idprefix, str(annotated_section_counts[idprefix]))
+  annotated_section_counts[(docname, idprefix)] += 1
+  return "%s_%s" % (idprefix, str(annotated_section_counts[(docname, idprefix)]))
+
+def purge_section_counts(app, env, docname):
+  for key in [key for key in annotated_section_counts if key[0] == docname]:
+    del annotated_section_counts[key]
 
 def slicer(stringList):
   for i in range(0, len(stringList)):
@@ -54,7 +62,8 @@ class AnnotatedSection(Directive):
         self.assert_has_content()
 
         env = self.state.document.settings.env
-        env.annotated_name = new_annotated_section_id(self.state_machine.get_source_and_line(self.lineno)[0])
+        page_assets.note_usage(env, 'annotated')
+        env.annotated_name = new_annotated_section_id(env.docname, self.state_machine.get_source_and_line(self.lineno)[0])
         env.annotated_annotation_count = 0
         env.annotated_now_within = True
 
@@ -271,106 +280,145 @@ def create_close_tag(number, section_name):
 def turn_to_close_tag(tag):
     return '</%s>' % re.findall('<(\w+).*?>', tag)[0]
 
+# Pygments output inside <pre> is split to tags, line changes and text.
+# An HTML entity in the text counts as a single character of the source code.
+markup_pattern = re.compile(r'<.*?>|\n')
+entity_pattern = re.compile(r'&#?\w+;?')
+
+def text_length(text):
+    '''Counts the characters of the source code in the HTML text.'''
+    if '&' not in text:
+        return len(text)
+    entities = entity_pattern.findall(text)
+    return len(text) - sum(map(len, entities)) + len(entities)
+
+def split_text(text, cuts):
+    '''Splits the text before the given character positions (in ascending order).'''
+    entities = entity_pattern.finditer(text) if '&' in text else iter(())
+    entity = next(entities, None)
+    extra = 0
+    pieces = []
+    previous = 0
+    for cut in cuts:
+        # Entities that begin before the cut are fully included in the piece.
+        while entity and entity.start() < cut + extra:
+            extra += entity.end() - entity.start() - 1
+            entity = next(entities, None)
+        pieces.append(text[previous:cut + extra])
+        previous = cut + extra
+    pieces.append(text[previous:])
+    return pieces
+
 def annotate(html, section_name, annotations):
     # sorting the annotations by their ending points correctly orders the starting points
     # for two annotations starting in the same location are correctly nested
     annotations = sorted(annotations, key = lambda x:x[3:5], reverse=True)
 
-    from collections import defaultdict
-    startpoint_map = defaultdict(list)
-    endpoint_map   = defaultdict(list)
+    startpoint_map = {}
+    endpoint_map   = {}
+    line_boundaries = {}
 
     # collect split points
     for a in annotations:
         number= a[0]
         start = a[1:3]
         end   = a[3:5]
-        startpoint_map[start].append(number)
-        endpoint_map[end].append(number)
-
+        startpoint_map.setdefault(start, []).append(number)
+        endpoint_map.setdefault(end, []).append(number)
+        line_boundaries.setdefault(start[0], set()).add(start[1])
+        line_boundaries.setdefault(end[0], set()).add(end[1])
+    line_boundaries = { line: sorted(locs) for line, locs in line_boundaries.items() }
+
+    open_tags = {
+        point: ''.join(create_open_tag(number, section_name) for number in numbers)
+        for point, numbers in startpoint_map.items()
+    }
+    close_tags = {
+        point: ''.join(create_close_tag(number, section_name) for number in numbers)
+        for point, numbers in endpoint_map.items()
+    }
+
+    def add_tags(tags, point):
+        if point in tags:
+            result.append(tags[point])
 
     html = html.replace("<span></span>", "") # temporary workaround for extra span created by Sphinx in Python 3
     parts = re.split('(<pre.*?>|</pre>)', html)
+    content = parts[2]
 
-    # separate tags from text
-    original = re.split('(<.*?>|\n)', parts[2])
-
-    #add splits
+    # walk the text between tags and line changes, jumping from one
+    # annotation boundary to the next instead of visiting each character
     line = 0
     loc  = 0
     result = []
     last_open  = ''
-
-    for item in original:
+    boundaries = line_boundaries.get(line, [])
+    i = 0
+
+    def add_text(text):
+        nonlocal loc
+        start_loc = loc
+        end_loc   = loc + text_length(text)
+        inner = boundaries[bisect_right(boundaries, start_loc):bisect_left(boundaries, end_loc)]
+        pieces = split_text(text, [point - start_loc for point in inner])
+
+        # add tags for opening annotations
+        if not last_open:
+            add_tags(open_tags, (line, start_loc))
+
+        result.append(pieces[0])
+        for point, piece in zip(inner, pieces[1:]):
+            # somewhere in the middle
+            if last_open:
+                result.append(turn_to_close_tag(last_open))
+            add_tags(close_tags, (line, point))
+            add_tags(open_tags, (line, point))
+            if last_open:
+                result.append(last_open)
+            result.append(piece)
+        loc = end_loc
+
+        # add tags for closing annotations
+        if not last_open:
+            add_tags(close_tags, (line, loc))
+
+    for m in markup_pattern.finditer(content):
+        if m.start() > i:
+            add_text(content[i:m.start()])
+        i = m.end()
+        item = m.group()
         if '</' in item:
             # closing tag
-
             result.append(item)
             last_open = ''
-
             # add any closing tags
-            for number in endpoint_map[(line, loc)]:
-                result.append(create_close_tag(number, section_name))
-
+            add_tags(close_tags, (line, loc))
         elif '<' in item:
             # opening tag
-
             # add tags for opening annotations
-            for number in startpoint_map[(line, loc)]:
-                result.append(create_open_tag(number, section_name))
-
+            add_tags(open_tags, (line, loc))
             last_open = item
             result.append(item)
-        elif '\n' in item:
+        else:
             # line change
-
             line += 1
             loc   = 0
-
+            boundaries = line_boundaries.get(line, [])
             result.append(item)
-        elif item:
-
-            chars = re.findall('(&#?\w+;?|.)', item)
-
-            # text element
-            start_loc = loc
-            end_loc   = loc + len(chars)
-
-            # add tags for opening annotations
-            if (not last_open):
-                for number in startpoint_map[(line, loc)]:
-                    result.append(create_open_tag(number, section_name))
-
-            # iterate over possible split locations and append chars
-
-            for char in chars:
-                if (loc != start_loc) & (loc != end_loc) & (((line, loc) in endpoint_map) | ((line, loc) in startpoint_map)):
-                    # somewhere in the middle
-                    if last_open:
-                        result.append(turn_to_close_tag(last_open))
-                    for number in endpoint_map[(line, loc)]:
-                       result.append(create_close_tag(number, section_name))
-                    for number in startpoint_map[(line, loc)]:
-                       result.append(create_open_tag(number, section_name))
-                    if last_open:
-                        result.append(last_open)
-
-                result.append(char)
-                loc += 1
-
-            # add tags for closing annotations
-            if (not last_open):
-                for number in endpoint_map[(line, loc)]:
-                    result.append(create_close_tag(number, section_name))
+    if i < len(content):
+        add_text(content[i:])
 
     content = ''.join(result)
     return ''.join([parts[0], parts[1], content, parts[3], parts[4]])
 
-def add_assets(app):
+def add_assets(app, pagename, templatename, context, doctree):
     # This method reads the `include_annotated_css` and `include_annotated_js`
     # settings from the conf.py file located in the course directory. If such
     # settings are not found, the default settings defined in the setup()
     #  method will be used instead
+    # The files are only added to the pages that contain annotated code.
+    if not page_assets.is_used(app.env, 'annotated', pagename):
+        return
     attrs = {"data-aplus": "yes"}
     app.config.include_annotated_css and app.add_css_file(CSS_FILE, **attrs)
     app.config.include_annotated_js and app.add_js_file(JS_FILE, **attrs)
@@ -379,7 +427,13 @@ def copy_asset_files(app, exc):
 
     if exc:
         return
-        
+
+    included = []
+    app.config.include_annotated_css and included.append(CSS_FILE)
+    app.config.include_annotated_js and included.append(JS_FILE)
+    page_assets.log_savings(app, 'annotated',
+        [os.path.join(os.path.dirname(__file__), assets_path, f) for f in included])
+
     # The files are added to the _build/html/_static/css folder. 
     if app.config.include_annotated_css:
         logger.info('Copying CSS files from the annotated directive to the _static folder... ')
@@ -415,6 +469,8 @@ def setup(app):
             latex=ignore_visitors)
     app.add_directive('altered-code-block', AlteredCodeBlock)
 
-    app.connect('builder-inited', add_assets)
+    app.setup_extension('lib.page_assets')
+    app.connect('html-page-context', add_assets)
+    app.connect('env-purge-doc', purge_section_counts)
 
     app.connect('build-finished', copy_asset_files)
@@ -24,6 +24,8 @@ from .div import DivNode
 from docutils.parsers.rst import Directive
 from docutils.parsers.rst import directives
 
+import lib.dependencies as dependencies
+
 class StyledTopicDirective(Directive):
 
     optional_arguments = 0
@@ -36,7 +38,7 @@ class StyledTopicDirective(Directive):
         text = '\n'.join(self.content)
         node = DivNode(text)
 
-        node['classes'].extend(directives.class_option(env.config['bootstrap_styled_topic_classes']))
+        node['classes'].extend(directives.class_option(dependencies.config_value(env, 'bootstrap_styled_topic_classes')))
         if 'class' in self.options:
             node['classes'].extend(self.options['class'])
 
@@ -1,9 +1,20 @@
 # -*- coding: utf-8 -*-
+import os
+import re
+import urllib.request
+
 import docutils
 from docutils import nodes
 from docutils.parsers.rst import Directive, directives
+from sphinx.util import logging
+from sphinx.util.fileutil import copy_asset
 
 import aplus_nodes
+import lib.dependencies as dependencies
+import lib.page_assets as page_assets
+import lib.translations as translations
+
+logger = logging.getLogger(__name__)
 
 # DIRECTIVE FOR ARTICULATE STORYLINE BLOCKS: story
 
@@ -63,13 +74,24 @@ def depart_jsvee_node(self, node):
 
 class youtube_node(nodes.General, nodes.Element): pass
 
+YOUTUBE_CSS_FILE = 'css/youtube.css'
+YOUTUBE_JS_FILE = 'js/youtube.js'
+YOUTUBE_THUMBNAIL_URL = 'https://i.ytimg.com/vi/{}/hqdefault.jpg'
+
 class YouTubeVideo(Directive):
     has_content = False
     required_arguments = 1
     optional_arguments = 0
-    option_spec = { 'video-height': directives.positive_int, 'video-width': directives.positive_int }
+    option_spec = {
+        'video-height': directives.positive_int,
+        'video-width': directives.positive_int,
+        'facade': directives.flag,
+        'no-facade': directives.flag,
+        'thumbnail': directives.uri,
+    }
 
     def run(self):
+        env = self.state.document.settings.env
         node = youtube_node()
         node['id'] = self.arguments[0]
         if 'video-width' in self.options:
@@ -80,14 +102,67 @@ class YouTubeVideo(Directive):
             node['video-height'] = self.options['video-height']
         else:
             node['video-height'] = 400
+        node['facade'] = 'facade' in self.options or (
+            dependencies.config_value(env, 'youtube_facade') and 'no-facade' not in self.options)
+        if node['facade']:
+            # The thumbnail is an image node so that Sphinx copies it to _images.
+            uri = self.options.get('thumbnail') or youtube_thumbnail(env, node['id'])
+            node += nodes.image(uri=uri, alt='')
+            node['label'] = translations.get(env, 'play_video')
+            page_assets.note_usage(env, 'youtube')
         return [node]
 
+def youtube_thumbnail(env, video_id):
+    ''' Returns the URI of the cached thumbnail of the video. The thumbnail is
+    downloaded into the youtube_thumbnail_dir unless it has been cached. '''
+    url = YOUTUBE_THUMBNAIL_URL.format(video_id)
+    cache_dir = os.path.join(env.app.confdir, dependencies.config_value(env, 'youtube_thumbnail_dir'))
+    path = os.path.join(cache_dir, re.sub(r'[^\w-]', '_', video_id) + '.jpg')
+    if not os.path.exists(path):
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                data = response.read()
+        except OSError as e:
+            logger.info('Could not download the thumbnail of the YouTube video {}, '
+                'loading it from YouTube instead: {}'.format(video_id, e))
+            return url
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+    # An absolute URI is relative to the source directory in Sphinx.
+    return '/' + os.path.relpath(path, env.srcdir).replace(os.sep, '/')
+
 def visit_youtube_node(self, node):
+    if node['facade']:
+        self.body.append('<button type="button" class="youtube-facade" data-video-id="%s" data-width="%s" data-height="%s" style="width: %spx; height: %spx" aria-label="%s">' % (self.attval(node['id']),node['video-width'],node['video-height'],node['video-width'],node['video-height'],self.attval(node['label'])))
+        return
     self.body.append('<iframe class="youtube-video" width="%s" height="%s" src="https://www.youtube-nocookie.com/embed/%s?rel=0" frameborder="0" allowfullscreen>' % (node['video-width'],node['video-height'],node['id']))
 
 def depart_youtube_node(self, node):
+    if node['facade']:
+        self.body.append('<span class="youtube-play"></span></button>\n')
+        return
     self.body.append("</iframe>\n")
 
+def skip_node(self, node):
+    raise nodes.SkipNode
+
+def add_youtube_assets(app, pagename, templatename, context, doctree):
+    if page_assets.is_used(app.env, 'youtube', pagename):
+        attrs = {"data-aplus": "yes"}
+        app.add_css_file(YOUTUBE_CSS_FILE, **attrs)
+        app.add_js_file(YOUTUBE_JS_FILE, **attrs)
+
+def copy_youtube_assets(app, exception):
+    if exception or app.builder.format != 'html':
+        return
+    if not getattr(app.env, 'aplus_page_assets', {}).get('youtube'):
+        return
+    static_dir = os.path.join(os.path.dirname(__file__), 'static')
+    for path in (YOUTUBE_CSS_FILE, YOUTUBE_JS_FILE):
+        copy_asset(os.path.join(static_dir, path),
+            os.path.join(app.outdir, '_static', os.path.dirname(path)))
+
 
 # DIRECTIVE FOR VIDEOS: local-video
 
@@ -165,9 +240,16 @@ def setup(app):
             latex=ignore_visitors)
     app.add_directive('jsvee', JSVEE)
 
+    app.add_config_value('youtube_facade', False, '')
+    app.add_config_value('youtube_thumbnail_dir', '_youtube', '')
     app.add_node(youtube_node, html=(visit_youtube_node, depart_youtube_node),
-            latex=ignore_visitors)
+            latex=(skip_node, None))
     app.add_directive('youtube', YouTubeVideo)
+    app.setup_extension('lib.page_assets')
+    # The documents that use the youtube settings.
+    app.setup_extension('lib.dependencies')
+    app.connect('html-page-context', add_youtube_assets)
+    app.connect('build-finished', copy_youtube_assets)
 
     app.add_node(video_node, html=(visit_video_node, depart_video_node),
             latex=ignore_visitors)
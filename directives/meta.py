@@ -4,6 +4,7 @@ from docutils.parsers.rst import Directive, directives
 from sphinx.errors import SphinxError
 
 from aplus_nodes import aplusmeta
+import lib.dependencies as dependencies
 from lib.revealrule import parse_reveal_rule
 
 class AplusMeta(Directive):
@@ -59,7 +60,7 @@ class AplusMeta(Directive):
 
     def run(self):
         env = self.state.document.settings.env
-        substitutions = env.config.aplusmeta_substitutions
+        substitutions = dependencies.config_value(env, 'aplusmeta_substitutions')
 
         # Substitute values of options if a corresponding string is found in
         # the configuration variable aplusmeta_substitutions (set in conf.py).
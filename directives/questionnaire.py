@@ -11,6 +11,7 @@ from sphinx.util import logging
 from sphinx.util.nodes import nested_parse_with_titles
 
 import aplus_nodes
+import lib.dependencies as dependencies
 import lib.translations as translations
 import lib.yaml_writer as yaml_writer
 from directives.abstract_exercise import ConfigurableExercise, choice_truefalse, str_to_bool
@@ -87,7 +88,7 @@ class Questionnaire(ConfigurableExercise):
 
         env = self.state.document.settings.env
         name = "{}_{}".format(env.docname.replace('/', '_'), key)
-        override = env.config.override
+        override = dependencies.config_value(env, 'override')
 
         env.questionnaire_is_feedback = is_feedback
         env.question_count = 0
@@ -120,9 +121,9 @@ class Questionnaire(ConfigurableExercise):
             'key': name,
             'category': category,
             'difficulty': difficulty or '',
-            'max_submissions': self.options.get('submissions', 0 if is_feedback else env.config.questionnaire_default_submissions),
-            'min_group_size': self.options.get('min-group-size', 1 if is_feedback else env.config.default_min_group_size),
-            'max_group_size': self.options.get('max-group-size', 1 if is_feedback else env.config.default_max_group_size),
+            'max_submissions': self.options.get('submissions', 0 if is_feedback else dependencies.config_value(env, 'questionnaire_default_submissions')),
+            'min_group_size': self.options.get('min-group-size', 1 if is_feedback else dependencies.config_value(env, 'default_min_group_size')),
+            'max_group_size': self.options.get('max-group-size', 1 if is_feedback else dependencies.config_value(env, 'default_max_group_size')),
             'points_to_pass': self.options.get('points-to-pass', 0),
             'feedback': is_feedback,
             'view_type': 'access.types.stdsync.createForm',
@@ -176,9 +177,9 @@ class Questionnaire(ConfigurableExercise):
             # questionnaires.
             node.attributes['data-aplus-quiz'] = 'yes'
 
-        if 'autosave' in self.options or env.config.enable_autosave:
+        if 'autosave' in self.options or dependencies.config_value(env, 'enable_autosave'):
             node.attributes['data-aplus-autosave'] = 'yes'
-        if 'disable-duplicate-check' in self.options or env.config.disable_duplicate_check:
+        if 'disable-duplicate-check' in self.options or dependencies.config_value(env, 'disable_duplicate_check'):
             node.attributes['data-aplus-disable-duplicate-check'] = 'yes'
 
         self.set_assistant_permissions(data)
@@ -904,7 +905,8 @@ class AgreeItemGenerate(AgreeItem):
         path = os.path.join(env.app.srcdir, self.options['config'])
         if not os.path.exists(path):
             raise SphinxError('Missing config path {}'.format(self.options['config']))
-        item_list = yaml_writer.read(path)
+        item_list = yaml_writer.read_config(path)
+        env.note_dependency(path) # Add the config file to the rst file's dependencies
 
         itemnodes = []
         for item in item_list:
@@ -3,7 +3,10 @@ import docutils
 from docutils import nodes
 from docutils.parsers.rst import Directive, directives
 from html import escape
+import io
+import os
 import re
+from sphinx.errors import SphinxError
 
 import aplus_nodes
 
@@ -18,53 +21,74 @@ class REPLSession(Directive):
     has_content = True
     required_arguments = 0
     optional_arguments = 0
-    option_spec = { }
+    option_spec = { 'file': directives.unchanged }
 
     def run(self):
+        env = self.state.document.settings.env
         node = repl_node()
-        node.content = self.content
+        if 'file' in self.options:
+            # Long transcripts may be stored in a separate file.
+            path = os.path.join(env.app.srcdir, self.options['file'])
+            if not os.path.exists(path):
+                raise SphinxError('Missing REPL transcript file {}'.format(self.options['file']))
+            with io.open(path, 'r', encoding='utf-8') as f:
+                node.content = f.read().splitlines()
+            env.note_dependency(path) # Add the transcript file to the rst file's dependencies
+        else:
+            node.content = self.content
         return [node]
 
-def visit_repl_node(self, node):
-    self.body.append('<pre class="repl literal-block">\n')
+res_start = re.compile(r"^res(\d+|X):")
+
+def render_repl(lines, res_count):
+    '''Renders the transcript lines as HTML. Returns the HTML and the next
+    free res number.'''
+    html = []
+
+    def clean_output(line):
+        nonlocal res_count
+        line = escape(line)
+        if res_start.match(line):
+            line = res_start.sub("res" + str(res_count) + ":", line)
+            res_count += 1
+        return line
 
     previouslyInInputBlock = False
-    for line in node.content:
-        htmlLine = ""
+    for line in lines:
         if line.startswith("> "):
             if previouslyInInputBlock:
-                htmlLine += '\n'
+                html.append('\n')
             else:
-                htmlLine += '<em>'
-            htmlLine += escape(line[2:])
+                html.append('<em>')
+            html.append(escape(line[2:]))
             previouslyInInputBlock = True
         elif line == "ø":                        # ø marks the non-output that the REPL provides when the result is Unit
             if previouslyInInputBlock:
-                htmlLine += '</em>'
+                html.append('</em>')
             previouslyInInputBlock = False
         else:
-            def clean_output(line):
-                line = escape(line)
-                resStart = re.compile("^res((\d+)|X):")
-                if re.match(resStart, line):
-                    env = self.builder.env
-                    line = resStart.sub("res" + str(env.repl_page_res_count) + ":", line)
-                    env.repl_page_res_count += 1
-                return line
             if previouslyInInputBlock:
-                htmlLine += '</em>'
+                html.append('</em>')
             if line.startswith("¡"):
-                htmlLine += '<strong>'
-                htmlLine += clean_output(line[1:])
-                htmlLine += '</strong>'
+                html.append('<strong>')
+                html.append(clean_output(line[1:]))
+                html.append('</strong>')
             else:
-                 htmlLine += clean_output(line)
-            htmlLine += '\n'
+                html.append(clean_output(line))
+            html.append('\n')
             previouslyInInputBlock = False
-        self.body += htmlLine
 
     if previouslyInInputBlock:
-        self.body += '</em>'
+        html.append('</em>')
+    return ''.join(html), res_count
+
+def visit_repl_node(self, node):
+    self.body.append('<pre class="repl literal-block">\n')
+    env = self.builder.env
+    html, res_count = render_repl(node.content, getattr(env, 'repl_page_res_count', 0))
+    if res_count != getattr(env, 'repl_page_res_count', 0):
+        env.repl_page_res_count = res_count
+    self.body.append(html)
 
 def depart_repl_node(self, node):
     self.body.append("</pre>\n")
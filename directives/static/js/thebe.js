@@ -28,6 +28,8 @@ SOFTWARE.
  */
 
 var initThebe = () => {
+    loadThebeAssets();
+
     // If Thebelab hasn't loaded, wait a bit and try again. This
     // happens because we load ClipboardJS asynchronously.
     if (window.thebelab === undefined) {
@@ -36,17 +38,24 @@ var initThebe = () => {
         return
     }
 
-    console.log("Adding thebe to code cells...");
-
-    // Load thebe config in case we want to update it as some point
-    thebe_config = $('script[type="text/x-thebe-config"]')[0]
-
-
     // If we already detect a Thebe cell, don't re-run
     if (document.querySelectorAll('div.thebe-cell').length > 0) {
         return;
     }
 
+    // The configuration is shared by the pages with the same kernel and
+    // directory and it is loaded from a static JSON file.
+    if (thebe_config === undefined) {
+        loadThebeConfig().then((config) => {
+            thebe_config = config;
+            kernelName = config.kernelOptions.kernelName;
+            initThebe();
+        });
+        return;
+    }
+
+    console.log("Adding thebe to code cells...");
+
     // Update thebe buttons with loading message
     $(".thebe-launch-button").each((ii, button) => {
         button.innerHTML = `
@@ -133,9 +142,49 @@ var initThebe = () => {
     });
 
     // Init thebe
-    thebelab.bootstrap();
+    thebelab.bootstrap(thebe_config);
 }
 
+var thebe_config = undefined;
+var kernelName = undefined;
+
+// Fetch the configuration file referenced by the page
+var loadThebeConfig = () => {
+    const link = document.querySelector('link[data-thebe-config]');
+    return fetch(link.href).then((response) => response.json());
+}
+
+// Load the deferred Thebe files when a Thebe button is first needed.
+// thebe_deferred_assets is only defined when thebe_defer_loading is set.
+var thebeAssetsRequested = false;
+var loadThebeAssets = () => {
+    if (thebeAssetsRequested || typeof thebe_deferred_assets === 'undefined') {
+        return;
+    }
+    thebeAssetsRequested = true;
+    thebe_deferred_assets.css.forEach((href) => {
+        const link = document.createElement('link');
+        link.rel = 'stylesheet';
+        link.href = href;
+        document.head.appendChild(link);
+    });
+    thebe_deferred_assets.js.forEach((src) => {
+        const script = document.createElement('script');
+        // Keep the execution order of the scripts.
+        script.async = false;
+        script.src = src;
+        document.head.appendChild(script);
+    });
+}
+
+['mouseover', 'focusin', 'touchstart'].forEach((eventName) => {
+    document.addEventListener(eventName, (event) => {
+        if (event.target.closest && event.target.closest('.thebe-launch-button')) {
+            loadThebeAssets();
+        }
+    }, { passive: true });
+});
+
 // Helper function to munge the language name
 var detectLanguage = (language) => {
     if (language.indexOf('python') > -1) {
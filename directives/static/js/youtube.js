@@ -0,0 +1,20 @@
+// Replaces the thumbnail of a youtube facade with the video player when the
+// facade is clicked. The click handler is delegated to the document so that
+// it also works for chapter content that is loaded later.
+jQuery(function ($) {
+  $(document).on("click", ".youtube-facade", function (event) {
+    event.preventDefault();
+    const facade = $(this);
+    const iframe = $("<iframe />", {
+      class: "youtube-video",
+      width: facade.data("width"),
+      height: facade.data("height"),
+      src: "https://www.youtube-nocookie.com/embed/" +
+        encodeURIComponent(facade.data("video-id")) + "?rel=0&autoplay=1",
+      frameborder: 0,
+      allow: "autoplay; encrypted-media; fullscreen",
+      allowfullscreen: true,
+    });
+    facade.replaceWith(iframe);
+  });
+});
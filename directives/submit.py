@@ -9,6 +9,7 @@ from sphinx.errors import SphinxError
 from sphinx.util.nodes import nested_parse_with_titles
 
 import aplus_nodes
+import lib.dependencies as dependencies
 import lib.translations as translations
 import lib.yaml_writer as yaml_writer
 from directives.abstract_exercise import ConfigurableExercise, choice_truefalse
@@ -67,7 +68,7 @@ class SubmitForm(ConfigurableExercise):
             args['data-aplus-quiz'] = 'yes'
         if 'ajax' in self.options:
             args['data-aplus-ajax'] = 'yes'
-        if 'disable-duplicate-check' in self.options or env.config.disable_duplicate_check:
+        if 'disable-duplicate-check' in self.options or dependencies.config_value(env, 'disable_duplicate_check'):
             args['data-aplus-disable-duplicate-check'] = 'yes'
         node = aplus_nodes.html('div', args)
 
@@ -78,7 +79,7 @@ class SubmitForm(ConfigurableExercise):
             path = os.path.join(env.app.srcdir, self.options['config'])
             if not os.path.exists(path):
                 raise SphinxError('Missing config path {}'.format(self.options['config']))
-            data = yaml_writer.read(path)
+            data = yaml_writer.read_config(path)
             config_title = data.get('title', '')
 
             env.note_dependency(path) # Add the config file to the rst file's dependencies
@@ -125,9 +126,9 @@ class SubmitForm(ConfigurableExercise):
             'category': 'submit',
             'scale_points': points,
             'difficulty': difficulty or '',
-            'max_submissions': self.options.get('submissions', data.get('max_submissions', env.config.program_default_submissions)),
-            'min_group_size': self.options.get('min-group-size', data.get('min_group_size', env.config.default_min_group_size)),
-            'max_group_size': self.options.get('max-group-size', data.get('max_group_size', env.config.default_max_group_size)),
+            'max_submissions': self.options.get('submissions', data.get('max_submissions', dependencies.config_value(env, 'program_default_submissions'))),
+            'min_group_size': self.options.get('min-group-size', data.get('min_group_size', dependencies.config_value(env, 'default_min_group_size'))),
+            'max_group_size': self.options.get('max-group-size', data.get('max_group_size', dependencies.config_value(env, 'default_max_group_size'))),
             'points_to_pass': self.options.get('points-to-pass', data.get('points_to_pass', 0)),
             # The RST source file path is needed for fixing relative URLs
             # in the exercise description.
@@ -144,11 +145,11 @@ class SubmitForm(ConfigurableExercise):
                 # has defined the title option (or alternatively, the yaml file
                 # has "title" in addition to "title|i18n", but that does not make sense).
                 # env.config.language may be incorrect if the language can not be detected.
-                data['title|i18n'][env.config.language] = env.config.submit_title.format(
+                data['title|i18n'][env.config.language] = dependencies.config_value(env, 'submit_title').format(
                     key_title=key_title, config_title=config_title
                 )
         else:
-            formatted_title = env.config.submit_title.format(
+            formatted_title = dependencies.config_value(env, 'submit_title').format(
                 key_title=key_title, config_title=config_title
             )
             # If no title has been defined, use key_title as the default.
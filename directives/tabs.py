@@ -34,6 +34,7 @@ from sphinx.util.fileutil import copy_asset
 from sphinx.util import logging
 
 import aplus_nodes
+import lib.page_assets as page_assets
 
 CSS_FILE = 'css/aplus_tab.css'
 JS_FILE = 'js/aplus_tab.js'
@@ -49,6 +50,7 @@ class NavTabDirective(Directive):
 
     def run(self):
         self.assert_has_content()
+        page_assets.note_usage(self.state.document.settings.env, 'tabs')
         text = '\n'.join(self.content)
         node = nodes.container(text)
         node['classes'].append('rst-tabs')
@@ -82,11 +84,14 @@ class TabContentDirective(Directive):
 
         return [node]
 
-def add_assets(app):
+def add_assets(app, pagename, templatename, context, doctree):
     # This method reads the `include_tab_css` and `include_tab_js`
     # settings from the conf.py file located in the course directory. If such
     # settings are not found, the default settings defined in the setup()
     #  method will be used instead
+    # The files are only added to the pages that contain tabs.
+    if not page_assets.is_used(app.env, 'tabs', pagename):
+        return
     attrs = {"data-aplus": "yes"}
     app.config.include_tab_css and app.add_css_file(CSS_FILE, **attrs)
     app.config.include_tab_js and app.add_js_file(JS_FILE, **attrs)
@@ -96,6 +101,12 @@ def copy_asset_files(app, exception):
     if exception:
         return
 
+    included = []
+    app.config.include_tab_css and included.append(CSS_FILE)
+    app.config.include_tab_js and included.append(JS_FILE)
+    page_assets.log_savings(app, 'tabs',
+        [os.path.join(os.path.dirname(__file__), assets_path, f) for f in included], label='rst-tabs')
+
         
     # The files are added to the _build/html/_static/css folder.
     # if app.config.include_tab_css:
@@ -123,5 +134,6 @@ def setup(app):
     app.add_directive('rst-tabs',  NavTabDirective)
     app.add_directive('tab-content', TabContentDirective)
 
-    app.connect('builder-inited', add_assets)
+    app.setup_extension('lib.page_assets')
+    app.connect('html-page-context', add_assets)
     app.connect('build-finished', copy_asset_files)
@@ -6,6 +6,12 @@ Changes:
   It used to be a hardcoded value, mybinder.org.
 * The JavaScript and CSS files are only copied to the build output directory
   if this Sphinx extension is enabled in conf.py.
+* The Thebe configuration of a page is written to a JSON file under
+  _static/thebe that is shared by all pages with the same kernel and
+  directory. It used to be an inline script in every page.
+* The JavaScript and CSS files are only added to the pages that contain
+  Thebe buttons. Loading the Thebe library may also be deferred until
+  a button is first hovered or clicked (thebe_defer_loading in conf.py).
 
 Original source:
 https://github.com/executablebooks/sphinx-thebe
@@ -38,6 +44,7 @@ SOFTWARE.
 """A sphinx extension to enable interactive computations using thebe."""
 
 
+import hashlib
 import json
 import os
 from pathlib import Path
@@ -45,6 +52,9 @@ from docutils.parsers.rst import Directive, directives
 from docutils import nodes
 from sphinx.util import logging
 from sphinx.util.fileutil import copy_asset
+from sphinx.util.osutil import ensuredir, relative_uri
+
+import lib.page_assets as page_assets
 __version__ = "0.0.8"
 
 CSS_FILE = 'css/thebe.css'
@@ -74,30 +84,48 @@ def init_thebe_default_config(app, env, docnames):
             thebe_config[key] = val
 
 
-def init_thebe_core(app, env):
-    config_thebe = app.config["thebe_config"]
-    if not config_thebe:
+# The core libraries. Only the files with the data-aplus attribute are
+# included in the A+ chapter pages by the aplus theme.
+THEBE_JS_FILES = [
+    (f"https://unpkg.com/thebe@{THEBE_VERSION}/lib/index.js", {"async": "async", "data-aplus": "yes"}),
+    ("https://codemirror.net/5/lib/codemirror.js", {}),
+    ("https://codemirror.net/5/mode/clike/clike.js", {}),
+    ("https://codemirror.net/5/mode/octave/octave.js", {}),
+    ("https://codemirror.net/5/addon/edit/matchbrackets.js", {}),
+]
+THEBE_CSS_FILES = [
+    ("https://codemirror.net/5/theme/eclipse.css", {"data-aplus": "yes"}),
+    ("https://codemirror.net/5/theme/abcdef.css", {"data-aplus": "yes"}),
+]
+
+
+def check_thebe_config(app, env):
+    if not app.config["thebe_config"]:
         logger.warning(
             "Didn't find `thebe_config` in conf.py, add to use thebe")
+
+
+def init_thebe_core(app, pagename, templatename, context, doctree):
+    """Add the Thebe files to the pages that contain Thebe buttons."""
+    if not app.config["thebe_config"] or not page_assets.is_used(app.env, "thebe", pagename):
         return
 
-    # Add core libraries
     opts = {"async": "async", "data-aplus": "yes"}
     css_opts = {"data-aplus": "yes"}
-    app.add_js_file(
-        filename=f"https://unpkg.com/thebe@{THEBE_VERSION}/lib/index.js", **opts)
-    app.add_js_file(
-        filename="https://codemirror.net/5/lib/codemirror.js")
-    app.add_js_file(
-        filename="https://codemirror.net/5/mode/clike/clike.js")
-    app.add_js_file(
-        filename="https://codemirror.net/5/mode/octave/octave.js")
-    app.add_js_file(
-        filename="https://codemirror.net/5/addon/edit/matchbrackets.js")
-    app.add_css_file(
-        filename="https://codemirror.net/5/theme/eclipse.css", **css_opts)
-    app.add_css_file(
-        filename="https://codemirror.net/5/theme/abcdef.css", **css_opts)
+    app.add_css_file(CSS_FILE, **css_opts)
+
+    # Add core libraries
+    deferred = {"js": [], "css": []}
+    for filename, attrs in THEBE_JS_FILES:
+        if app.config.thebe_defer_loading and "data-aplus" in attrs:
+            deferred["js"].append(filename)
+        else:
+            app.add_js_file(filename=filename, **attrs)
+    for filename, attrs in THEBE_CSS_FILES:
+        if app.config.thebe_defer_loading and "data-aplus" in attrs:
+            deferred["css"].append(filename)
+        else:
+            app.add_css_file(filename=filename, **attrs)
 
     # Add configuration variables
     thebe_config = f"""
@@ -105,6 +133,11 @@ def init_thebe_core(app, env):
         const thebe_selector_input = "{ app.config.thebe_config['selector_input'] }"
         const thebe_selector_output = "{ app.config.thebe_config['selector_output'] }"
     """
+    if app.config.thebe_defer_loading:
+        # thebe.js loads these files when a Thebe button is first hovered or clicked.
+        thebe_config += f"""
+        const thebe_deferred_assets = {json.dumps(deferred)}
+    """
     app.add_js_file(None, body=thebe_config, **opts)
     app.add_js_file(filename=JS_FILE, **opts)
 
@@ -112,7 +145,9 @@ def init_thebe_core(app, env):
 def update_thebe_context(app, doctree, docname):
     """Add thebe config nodes to this doctree."""
     config_thebe = app.config["thebe_config"]
-    if not config_thebe:
+    if not config_thebe or app.builder.format != "html":
+        return
+    if not page_assets.is_used(app.env, "thebe", docname):
         return
 
     # Thebe configuration
@@ -186,43 +221,69 @@ def update_thebe_context(app, doctree, docname):
         codemirror_line_numbers = codemirror_config.get(
             "lineNumbers", codemirror_line_numbers)
         codemirror_mode = codemirror_config.get("mode", codemirror_mode)
-    # Update the doctree with some nodes for the thebe configuration
-    thebe_html_config = f"""
-    <script type="text/x-thebe-config">
-    {{
-        requestKernel: true,
-        binderOptions: {{
-            binderUrl: "{binder_url}",
-            repo: "{org}/{repo}",
-            ref: "{branch}",
-            repoProvider: "{provider}",
-            codeMirrorConfig: {{
-                theme: '{codemirror_theme}',
-                mode: '{codemirror_mode}',
-                lineNumbers: {codemirror_line_numbers},
-                electricChars: {codemirror_electric_chars},
-                indentUnit: {codemirror_indent_unit},
-                indentWithTabs: {codemirror_indent_with_tabs},
-                matchBrackets: true,
-            }},
-        }},
-        kernelOptions: {{
-            name: "{kernel_name}",
-            kernelName: "{kernel_name}",
-            path: "{path_to_docs}{str(Path(docname).parent)}"
-        }},
-        predefinedOutput: true
-    }}
-    </script>
-    """
+    # The configuration is identical for all pages with the same kernel and
+    # directory. It is written to a shared JSON file that the pages refer to.
+    thebe_page_config = {
+        "requestKernel": True,
+        "binderOptions": {
+            "binderUrl": binder_url,
+            "repo": f"{org}/{repo}",
+            "ref": branch,
+            "repoProvider": provider,
+            "codeMirrorConfig": {
+                "theme": codemirror_theme,
+                "mode": codemirror_mode,
+                "lineNumbers": _js_value(codemirror_line_numbers),
+                "electricChars": _js_value(codemirror_electric_chars),
+                "indentUnit": _js_value(codemirror_indent_unit),
+                "indentWithTabs": _js_value(codemirror_indent_with_tabs),
+                "matchBrackets": True,
+            },
+        },
+        "kernelOptions": {
+            "name": kernel_name,
+            "kernelName": kernel_name,
+            "path": f"{path_to_docs}{str(Path(docname).parent)}",
+        },
+        "predefinedOutput": True,
+    }
+    config_file = _write_thebe_config(app, thebe_page_config)
+    config_uri = relative_uri(app.builder.get_target_uri(docname), config_file)
 
-    doctree.append(nodes.raw(text=thebe_html_config, format="html"))
     doctree.append(
         nodes.raw(
-            text=f"<script>kernelName = '{kernel_name}'</script>", format="html")
+            text=f'<link rel="preload" as="fetch" crossorigin="anonymous" href="{config_uri}" data-thebe-config="yes">',
+            format="html")
     )
 
 
+def _js_value(value):
+    """Convert a configuration value to the JSON value that the former inline
+    JavaScript configuration would have evaluated to."""
+    if isinstance(value, str):
+        if value.strip() in ("true", "false"):
+            return value.strip() == "true"
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _write_thebe_config(app, thebe_page_config):
+    """Write the configuration under _static/thebe and return its path in the
+    output directory. The file is named by its content hash."""
+    content = json.dumps(thebe_page_config, indent=2, sort_keys=True)
+    digest = hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+    filename = f"_static/thebe/config-{digest}.json"
+    path = os.path.join(app.outdir, filename)
+    if not os.path.exists(path):
+        ensuredir(os.path.dirname(path))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+    return filename
+
+
 def _split_repo_url(url):
     """Split a repository URL into an org / repo combination."""
     if "github.com/" in url:
@@ -278,6 +339,7 @@ class ThebeButton(Directive):
     has_content = False
 
     def run(self):
+        page_assets.note_usage(self.state.document.settings.env, "thebe")
         kwargs = {"text": self.arguments[0]} if self.arguments else {}
         return [ThebeButtonNode(**kwargs)]
 
@@ -326,6 +388,7 @@ class ThebePrecellButton(Directive):
     has_content = False
 
     def run(self):
+        page_assets.note_usage(self.state.document.settings.env, "thebe")
         kwargs = {"text": self.arguments[0]} if self.arguments else {}
         return [ThebePrecellButtonNode(**kwargs)]
 
@@ -349,20 +412,19 @@ def setup(app):
     # Set default values for the configuration
     app.connect("env-before-read-docs", init_thebe_default_config)
 
-    # Include Thebe core docs
+    # Include Thebe core docs on the pages that use Thebe
+    app.setup_extension("lib.page_assets")
     app.connect("doctree-resolved", update_thebe_context)
-    app.connect("env-updated", init_thebe_core)
+    app.connect("env-updated", check_thebe_config)
+    app.connect("html-page-context", init_thebe_core)
 
     # configuration for this tool
     app.add_config_value("thebe_config", {}, "html")
+    app.add_config_value("thebe_defer_loading", False, "html")
     # override=True in case Jupyter Sphinx has already been loaded
     app.add_directive("thebe-button", ThebeButton, override=True)
     app.add_directive("thebe-precell-button", ThebePrecellButton, override=True)
 
-    # Add relevant code to headers
-    opts = {'data-aplus': 'yes'}
-    app.add_css_file(CSS_FILE, **opts)
-
     # The files are added to the _build/html/_static/css folder.
     logger.info(
         'Copying CSS files from the thebe-button directive to the _static folder... ')
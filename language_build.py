@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+'''
+Builds each language tree of a multilingual course in its own process and
+joins the language versions afterwards.
+
+The language trees are the toctree entries of the master document
+(index_en, index_fi, ...). Each tree is built as a shard (see lib/shards.py)
+with sphinx-build into _build/languages/<language>, and the builds run in
+parallel. The outputs are then copied into _build/html and _build/yaml and
+the indexes and the exercises of the languages are joined with
+toc_languages.join, like in a build of the whole course. The wall time is
+about the time of the slowest language instead of the sum of the languages.
+
+Example (in the course directory):
+
+    python3 a-plus-rst-tools/language_build.py
+    python3 a-plus-rst-tools/language_build.py --languages en,fi --workers 2 .
+'''
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'directives'))
+
+from sphinx.config import Config
+from sphinx.errors import SphinxError
+
+import lib.shards as shards
+
+
+def language_trees(course):
+    ''' Returns the (language, docname) pairs of the master toctree. '''
+    config = Config.read(course)
+    config.init_values()
+    trees = []
+    for docname in shards.master_toctree_entries(course, config):
+        # The language postfix like in toc_config.set_config_language_for_doc.
+        m = re.search(r'_([a-z]{2})$', docname)
+        if m:
+            trees.append((m.group(1), docname))
+    return trees
+
+
+def build_language(course, build_dir, lang, docname, clean):
+    ''' Builds one language tree with sphinx-build. '''
+    os.makedirs(build_dir, exist_ok=True)
+    command = [
+        sys.executable, '-m', 'sphinx', '-q', '-b', 'html',
+        '-d', os.path.join(build_dir, 'doctrees'),
+        '-D', 'build_modules=' + docname,
+        '-D', 'yaml_dir=' + os.path.join(build_dir, 'yaml'),
+    ]
+    if clean:
+        command.append('-E')
+    command += [course, os.path.join(build_dir, 'html')]
+    start = time.perf_counter()
+    with open(os.path.join(build_dir, 'build.log'), 'w', encoding='utf-8') as log:
+        result = subprocess.run(command, cwd=course, stdout=log, stderr=subprocess.STDOUT)
+    return lang, result.returncode, time.perf_counter() - start
+
+
+def main():
+    p = argparse.ArgumentParser(description='Build the language trees of a course in parallel.')
+    p.add_argument('course', nargs='?', default='.', help='course directory (default: .)')
+    p.add_argument('--languages', type=lambda value: [v.strip() for v in value.split(',') if v.strip()],
+        help='comma-separated languages to build (default: all the language trees)')
+    p.add_argument('--workers', type=int, help='number of parallel builds (default: one per language)')
+    p.add_argument('--clean', action='store_true', help='build all the documents again (sphinx-build -E)')
+    args = p.parse_args()
+
+    course = os.path.abspath(args.course)
+    trees = language_trees(course)
+    if args.languages:
+        trees = [(lang, docname) for lang, docname in trees if lang in args.languages]
+    if not trees:
+        p.error('No language trees (e.g., index_en) in the toctree of the master document.')
+
+    build_root = os.path.join(course, '_build')
+    builds = [(lang, os.path.join(build_root, 'languages', lang)) for lang, _ in trees]
+    start = time.perf_counter()
+    failed = []
+    with ThreadPoolExecutor(args.workers or len(trees)) as executor:
+        jobs = [
+            executor.submit(build_language, course, build_dir, lang, docname, args.clean)
+            for (lang, docname), (_, build_dir) in zip(trees, builds)
+        ]
+        for job in jobs:
+            lang, status, elapsed = job.result()
+            print('{:<8} {:>8.1f} s  {}'.format(lang, elapsed, 'ok' if status == 0 else 'failed'), flush=True)
+            if status != 0:
+                failed.append(lang)
+    if failed:
+        for lang in failed:
+            print('See {}'.format(os.path.join(build_root, 'languages', lang, 'build.log')))
+        return 1
+
+    os.chdir(course)
+    try:
+        index = shards.merge_languages(build_root, builds)
+    except SphinxError as error:
+        print(error)
+        return 1
+    print('Joined {} with {:d} modules in {:.1f} s.'.format(
+        ', '.join(lang for lang, _ in trees), len(index['modules']), time.perf_counter() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
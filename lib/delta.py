@@ -0,0 +1,206 @@
+'''
+Writes a manifest of the content hashes of the build output and a delta
+archive of the files that changed since a previous manifest.
+
+The stage is enabled with the config value delta_manifest. At the end of the
+build, the SHA-256 hashes of the files in _build/html and the YAML directory
+(_build/yaml or yaml_dir) are written into _build/manifest.json. In the
+manifest and the archive, the files are under html/ and yaml/ wherever the
+YAML directory is. The files whose modification time and
+size are the same as in the previous manifest are not hashed again.
+
+If the config value delta_base_manifest is the path of an earlier manifest,
+e.g., the manifest of the deployed build, the files that were added or
+changed since it are written into the archive _build/delta.tar.gz. The
+archive also contains delta.json, which lists the changed and the removed
+files and the identifiers of both manifests, and the new manifest. The
+deployment applies the archive with deploy_delta.py apply, or by extracting
+it and removing the removed files.
+'''
+import hashlib
+import io
+import json
+import os
+import tarfile
+
+from sphinx.util import logging
+
+import lib.profiler as profiler
+
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_DIRS = ('html', 'yaml')
+MANIFEST_NAME = 'manifest.json'
+ARCHIVE_NAME = 'delta.tar.gz'
+DELTA_NAME = 'delta.json'
+
+
+def write_delta(app, exception):
+    if exception or not app.config.delta_manifest:
+        return
+    with profiler.phase('delta'):
+        _write_delta(app)
+
+
+def _write_delta(app):
+    build_dir = os.path.dirname(app.outdir)
+    directories = {'html': app.outdir, 'yaml': app.env.yaml_dir}
+    manifest_path = os.path.join(build_dir, MANIFEST_NAME)
+    manifest = make_manifest(build_dir, read_manifest(manifest_path), directories)
+    write_manifest(manifest_path, manifest)
+
+    base_path = app.config.delta_base_manifest
+    if not base_path:
+        logger.info('Wrote the manifest of {:d} output files.'.format(len(manifest['files'])))
+        return
+    base = read_manifest(os.path.join(app.confdir, base_path))
+    if base is None:
+        logger.warning('delta_base_manifest {} can not be read, the delta contains all the files.'.format(base_path))
+    changed, removed = compare(base, manifest)
+    write_archive(os.path.join(build_dir, ARCHIVE_NAME), build_dir, base, manifest, changed, removed, directories)
+    logger.info('Wrote the delta of {:d} changed and {:d} removed files (of {:d}).'.format(
+        len(changed), len(removed), len(manifest['files'])))
+
+
+def output_directories(build_dir, directories=None):
+    ''' Returns the paths of the output directories html and yaml. The
+    directories overrides the default paths under the build directory. '''
+    paths = {directory: os.path.join(build_dir, directory) for directory in OUTPUT_DIRS}
+    paths.update(directories or {})
+    return paths
+
+
+def source_path(build_dir, relpath, directories=None):
+    ''' Returns the path of the file of the manifest path, e.g., yaml/index.yaml. '''
+    directory, _, rest = relpath.partition('/')
+    return os.path.join(output_directories(build_dir, directories)[directory], *rest.split('/'))
+
+
+def make_manifest(build_dir, old=None, directories=None):
+    ''' Returns the manifest of the output files in the build directory. '''
+    old_files = old['files'] if old else {}
+    files = {}
+    for directory, directory_path in output_directories(build_dir, directories).items():
+        for root, dirnames, filenames in os.walk(directory_path):
+            # The doctrees of sphinx-build without -M are not a part of the output.
+            dirnames[:] = [d for d in dirnames if d != '.doctrees']
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                relpath = directory + '/' + os.path.relpath(path, directory_path).replace(os.sep, '/')
+                st = os.stat(path)
+                entry = old_files.get(relpath)
+                if not entry or entry['size'] != st.st_size or entry['mtime'] != st.st_mtime_ns:
+                    entry = {'sha256': _hash(path), 'size': st.st_size, 'mtime': st.st_mtime_ns}
+                files[relpath] = entry
+    return {'id': _manifest_id(files), 'files': files}
+
+
+def compare(base, manifest):
+    ''' Returns the files that were added or changed and the files that were
+    removed since the base manifest. '''
+    base_files = base['files'] if base else {}
+    files = manifest['files']
+    changed = sorted(
+        relpath for relpath, entry in files.items()
+        if relpath not in base_files or base_files[relpath]['sha256'] != entry['sha256']
+    )
+    removed = sorted(set(base_files) - set(files))
+    return changed, removed
+
+
+def write_archive(path, build_dir, base, manifest, changed, removed, directories=None):
+    delta = {
+        'base': base['id'] if base else None,
+        'id': manifest['id'],
+        'changed': changed,
+        'removed': removed,
+    }
+    tmp_path = path + '.tmp'
+    with tarfile.open(tmp_path, 'w:gz') as tar:
+        data = json.dumps(delta, indent=2).encode('utf-8')
+        info = tarfile.TarInfo(DELTA_NAME)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+        data = json.dumps(manifest, indent=0, sort_keys=True).encode('utf-8')
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+        for relpath in changed:
+            tar.add(source_path(build_dir, relpath, directories), arcname=relpath, recursive=False)
+    os.replace(tmp_path, path)
+    return delta
+
+
+def apply_archive(path, build_dir, current_id=None, force=False):
+    ''' Applies the delta archive to a copy of the previous output. The
+    current_id is the identifier of the manifest of the copy. '''
+    with tarfile.open(path, 'r:gz') as tar:
+        names = set(tar.getnames())
+        if DELTA_NAME not in names:
+            raise ValueError('{} is missing from the archive.'.format(DELTA_NAME))
+        delta = json.load(tar.extractfile(DELTA_NAME))
+        if not force and current_id and delta['base'] and current_id != delta['base']:
+            raise ValueError('The delta is based on another version of the output.')
+        # The manifest of the applied output is extracted too.
+        relpaths = delta['changed'] + [MANIFEST_NAME]
+        for relpath in relpaths:
+            if relpath not in names:
+                raise ValueError('{} is missing from the archive.'.format(relpath))
+        members = [tar.getmember(relpath) for relpath in relpaths]
+        for member in members:
+            if os.path.isabs(member.name) or '..' in member.name.split('/'):
+                raise ValueError('Unsafe path in the archive: {}'.format(member.name))
+        for relpath in delta['removed']:
+            if os.path.isabs(relpath) or '..' in relpath.split('/'):
+                raise ValueError('Unsafe path in the archive: {}'.format(relpath))
+        if hasattr(tarfile, 'data_filter'):
+            # The filter also rejects links and special files.
+            tar.extractall(build_dir, members, filter='data')
+        else:
+            tar.extractall(build_dir, members)
+    for relpath in delta['removed']:
+        try:
+            os.remove(os.path.join(build_dir, relpath))
+        except FileNotFoundError:
+            pass
+    return delta
+
+
+def read_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(path, manifest):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+
+
+def _hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _manifest_id(files):
+    h = hashlib.sha256()
+    for relpath in sorted(files):
+        h.update('{}\0{}\n'.format(relpath, files[relpath]['sha256']).encode('utf-8'))
+    return h.hexdigest()
+
+
+def setup(app):
+    app.add_config_value('delta_manifest', False, 'html')
+    app.add_config_value('delta_base_manifest', None, 'html')
+    # Run after the precompressed files have been written.
+    app.connect('build-finished', write_delta, priority=950)
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
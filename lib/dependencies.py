@@ -0,0 +1,86 @@
+'''
+Dependencies of the documents on the config values of conf.py.
+
+The directives read some config values, e.g., override and
+aplusmeta_substitutions, when the documents are read, and the values are
+stored in the doctrees. Sphinx re-reads documents only when the config values
+registered with the rebuild flag 'env' change, which would re-read all the
+documents. Instead, the directives read the values through config_value(),
+which records the documents that used each value. When a recorded value
+changes in conf.py, only the documents that used it are read again.
+
+The config values that only the index stage (toc_config.write) uses, such as
+categories, category_names and append_content, need no tracking because the
+index is made again in every build.
+'''
+import copy
+
+from sphinx.util import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def config_value(env, name):
+    ''' Returns the config value and records that the current document uses it. '''
+    if env.docname:
+        docs = env.aplus_config_docs.setdefault(name, set())
+        docs.add(env.docname)
+    return env.config[name]
+
+
+def init_env(app):
+    env = app.env
+    if not hasattr(env, 'aplus_config_docs'):
+        # The documents that used each config value.
+        env.aplus_config_docs = {}
+    if not hasattr(env, 'aplus_config_values'):
+        # The config values when the documents were read.
+        env.aplus_config_values = {}
+
+
+def changed_docs(app, env, added, changed, removed):
+    ''' Returns the documents whose config values have changed. '''
+    outdated = set()
+    for name, docs in env.aplus_config_docs.items():
+        if name not in app.config:
+            continue
+        value = app.config[name]
+        if name in env.aplus_config_values and env.aplus_config_values[name] != value:
+            logger.info('Config value {} changed, reading {:d} documents again.'.format(name, len(docs)))
+            outdated.update(docs)
+    for name in env.aplus_config_docs:
+        if name in app.config:
+            env.aplus_config_values[name] = copy.deepcopy(app.config[name])
+    return sorted((outdated & env.found_docs) - added - changed - removed)
+
+
+def purge_doc(app, env, docname):
+    for docs in env.aplus_config_docs.values():
+        docs.discard(docname)
+
+
+def merge_info(app, env, docnames, other):
+    for name, docs in other.aplus_config_docs.items():
+        env.aplus_config_docs.setdefault(name, set()).update(docs & set(docnames))
+
+
+def record_values(app, env):
+    ''' Records the values of the config values that were used for the first time. '''
+    for name in env.aplus_config_docs:
+        if name not in env.aplus_config_values and name in app.config:
+            env.aplus_config_values[name] = copy.deepcopy(app.config[name])
+
+
+def setup(app):
+    app.connect('builder-inited', init_env)
+    app.connect('env-get-outdated', changed_docs)
+    app.connect('env-purge-doc', purge_doc)
+    app.connect('env-merge-info', merge_info)
+    app.connect('env-updated', record_values)
+    return {
+        # The environments of the earlier versions did not record all the uses.
+        'env_version': 2,
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
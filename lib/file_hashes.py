@@ -0,0 +1,147 @@
+'''
+Content hashes of the course files that the graders fetch on configure.
+
+The configure payload of an exercise and the entries of course_configures map
+the paths on the grader to the paths in the course repository. If the config
+value configure_file_hashes is set, a "file_hashes" dict with the SHA-256 of
+each path is added next to the "files" dict, so that a grader can fetch only
+the files that changed. The hash of a directory (e.g., a container mount) is
+computed from the relative paths and the hashes of the files in it.
+
+The hashes are cached by the modification time and the size of the files, so
+a file that many exercises share is read only once, and the warm builds of
+the watch mode and the build server read only the changed files again.
+
+The hashed files are dependencies of the document, so the document is read
+again when they change. Sphinx can not depend on a directory, so the listing
+of each hashed directory is saved too, and a document is read again if a file
+has been added to or removed from its directories.
+'''
+import hashlib
+import os
+
+from sphinx.util import logging
+
+
+logger = logging.getLogger(__name__)
+
+_hashes = {}
+
+
+def file_hash(path):
+    ''' Returns the SHA-256 of the file, cached by mtime and size. '''
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _hashes.get(path)
+    if cached is None or cached[0] != stamp:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                h.update(block)
+        cached = _hashes[path] = (stamp, h.hexdigest())
+    return cached[1]
+
+
+def directory_files(path):
+    ''' Returns the files in the directory as (relative path, path) sorted. '''
+    files = []
+    for root, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            full_path = os.path.join(root, filename)
+            files.append((os.path.relpath(full_path, path).replace(os.sep, '/'), full_path))
+    return sorted(files)
+
+
+def listing_signature(files):
+    ''' Returns the hash of the relative paths of directory_files(). '''
+    h = hashlib.sha256()
+    for relpath, full_path in files:
+        h.update(relpath.encode('utf-8') + b'\0')
+    return h.hexdigest()
+
+
+def path_hash(path):
+    ''' Returns the hash of a file or a directory. '''
+    if not os.path.isdir(path):
+        return file_hash(path)
+    h = hashlib.sha256()
+    for relpath, full_path in directory_files(path):
+        h.update('{}\0{}\n'.format(relpath, file_hash(full_path)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def configure_hashes(srcdir, files, env=None):
+    ''' Returns the hashes of the configure files {path on grader: path in
+    repository} as {path on grader: hash}. If env is given, the files are
+    noted as dependencies of the current document, so that the document is
+    read again and its hashes updated when the files change. '''
+    hashes = {}
+    for grader_path, repo_path in files.items():
+        path = os.path.join(srcdir, repo_path)
+        try:
+            hashes[grader_path] = path_hash(path)
+        except OSError as error:
+            logger.warning('No hash for the configure file {}: {}'.format(repo_path, error))
+            continue
+        if env is not None:
+            if os.path.isdir(path):
+                dir_files = directory_files(path)
+                for relpath, full_path in dir_files:
+                    env.note_dependency(full_path)
+                directories = env.aplus_configure_dirs.setdefault(env.docname, {})
+                directories[path] = listing_signature(dir_files)
+            else:
+                env.note_dependency(path)
+    return hashes
+
+
+def add_course_configure_hashes(srcdir, configures):
+    ''' Returns a copy of course_configures with the file hashes. '''
+    result = []
+    for configure in configures:
+        configure = dict(configure)
+        configure['file_hashes'] = configure_hashes(srcdir, configure.get('files', {}))
+        result.append(configure)
+    return result
+
+
+def init_env(app):
+    if not hasattr(app.env, 'aplus_configure_dirs'):
+        # The hashed directories of each document: {docname: {path: listing}}
+        app.env.aplus_configure_dirs = {}
+
+
+def changed_directories(app, env, added, changed, removed):
+    ''' Returns the documents whose hashed directories have new or removed files. '''
+    outdated = []
+    for docname, directories in env.aplus_configure_dirs.items():
+        if docname in changed or docname in removed:
+            continue
+        for path, signature in directories.items():
+            if not os.path.isdir(path) or listing_signature(directory_files(path)) != signature:
+                outdated.append(docname)
+                break
+    return outdated
+
+
+def purge_doc(app, env, docname):
+    env.aplus_configure_dirs.pop(docname, None)
+
+
+def merge_info(app, env, docnames, other):
+    for docname in docnames:
+        if docname in other.aplus_configure_dirs:
+            env.aplus_configure_dirs[docname] = other.aplus_configure_dirs[docname]
+
+
+def setup(app):
+    app.connect('builder-inited', init_env)
+    app.connect('env-get-outdated', changed_directories)
+    app.connect('env-purge-doc', purge_doc)
+    app.connect('env-merge-info', merge_info)
+    return {
+        # The environments of the earlier versions did not save the listings.
+        'env_version': 1,
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
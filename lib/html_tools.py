@@ -2,18 +2,32 @@ import fnmatch
 import io, os, re
 
 import yaml
+from sphinx.util.images import get_image_size
 
+# The first images and iframes of a page are likely visible when the page
+# opens, so they are not loaded lazily.
+EAGER_ELEMENTS = 1
 
-def rewrite_outdir(out_dir, chapter_dirs, static_host):
+# Image sizes by path: (modification time, (width, height) or None)
+_image_sizes = {}
+
+
+def rewrite_outdir(out_dir, chapter_dirs, static_host, lazy_loading=False, image_sizes=False,
+        yaml_dir=None):
     build_dir = os.path.dirname(out_dir)
     if static_host and not static_host.endswith('/'):
         static_host += '/'
-    for path in _walk(build_dir):
-        rewrite_file_links(path, out_dir, chapter_dirs, static_host)
+    media = {'lazy_loading': lazy_loading, 'image_sizes': image_sizes}
+    paths = _walk(build_dir)
+    # The YAML output may be outside the build directory (yaml_dir).
+    if yaml_dir and not is_inside(yaml_dir, build_dir):
+        paths += _walk(yaml_dir)
+    for path in paths:
+        rewrite_file_links(path, out_dir, chapter_dirs, static_host, media)
 
 
-def rewrite_file_links(path, root, chapter_dirs, static_host):
-    content = _read_file(path)
+def rewrite_file_links(path, root, chapter_dirs, static_host, media=None):
+    content = original = _read_file(path)
     link_elements = [
         ('a', 'href'),
     ]
@@ -41,6 +55,7 @@ def rewrite_file_links(path, root, chapter_dirs, static_host):
             'data-aplus-chapter ',
             'data-aplus-path="/static/{course}" ',
             yaml_data_dict.get('_rst_srcpath|i18n', yaml_data_dict.get('_rst_srcpath')),
+            media=media,
         )
         # _rst_srcpath is an internal value stored in the YAML file.
         # It is the path of the RST source file that contains the exercise.
@@ -61,13 +76,17 @@ def rewrite_file_links(path, root, chapter_dirs, static_host):
             chapter_dirs,
             'data-aplus-chapter ',
             'data-aplus-path="/static/{course}" ',
+            media=media,
         )
-    _write_file(path, content)
+    # Unchanged files are not written, so their modification times
+    # tell which files the build changed.
+    if content != original:
+        _write_file(path, content)
 
 
 def rewrite_links(content, path, root, link_elements, other_elements,
                     static_host, chapter_dirs, chapter_append, yaml_append,
-                    rst_src_path=None):
+                    rst_src_path=None, media=None):
     q1 = re.compile(r'^(\w+:|//|#)') # Starts with "https:", "//" or "#".
     q2 = re.compile(r'^(' + '|'.join(chapter_dirs) + r')(/|\\)') # Starts with a module directory name.
     for tag, attr in link_elements:
@@ -77,21 +96,34 @@ def rewrite_links(content, path, root, link_elements, other_elements,
     for tag, attr in other_elements:
         content = rewrite_elements(content, tag, attr, path, root,
                                     q1, static_host, None, None, yaml_append,
-                                    rst_src_path)
+                                    rst_src_path, media)
     return content
 
 
 def rewrite_elements(content, tag, attr, path, root, q1, static_host, q2, append,
-                    yaml_append, rst_src_path=None):
+                    yaml_append, rst_src_path=None, media=None):
     dir_name = os.path.dirname(path)
     out = ""
     p = re.compile(
         r'<' + tag + r'\s+[^<>]*'
         r'(?P<attr>' + attr + r')=(?P<slash>\\?)"(?P<val>[^"?#]*)'
     )
+    add_media_attributes = media and tag in ('img', 'iframe') and (
+        media.get('lazy_loading') or (tag == 'img' and media.get('image_sizes')))
+    count = 0
     i = 0
     for m in p.finditer(content):
         val = m.group('val')
+
+        if add_media_attributes and not m.group('slash'):
+            # Add attributes right after the tag name.
+            count += 1
+            j = m.start() + len(tag) + 1
+            out += content[i:j] + media_attributes(
+                content[m.start():content.find('>', m.start())],
+                tag, val, path, root, q1, rst_src_path, media, count > EAGER_ELEMENTS)
+            i = j
+
         if val and not q1.search(val):
 
             # Add content up to attribute.
@@ -170,6 +202,50 @@ def rewrite_elements(content, tag, attr, path, root, q1, static_host, q2, append
     return out
 
 
+def media_attributes(element, tag, val, path, root, q1, rst_src_path, media, lazy):
+    '''Return the loading and size attributes that the element lacks.'''
+    attrs = ''
+    if media.get('lazy_loading') and lazy:
+        if not re.search(r'\sloading=', element):
+            attrs += ' loading="lazy"'
+        if tag == 'img' and not re.search(r'\sdecoding=', element):
+            attrs += ' decoding="async"'
+    if (media.get('image_sizes') and tag == 'img' and val and not q1.search(val)
+            and not re.search(r'\s(width|height|style)=', element)):
+        if not path.endswith('.yaml'):
+            full = os.path.realpath(os.path.join(os.path.dirname(path), val))
+        elif rst_src_path:
+            full = os.path.realpath(os.path.join(root, os.path.dirname(rst_src_path), val))
+        else:
+            full = None
+        size = image_size(full) if full and full.startswith(root) else None
+        if size:
+            attrs += ' width="{:d}" height="{:d}"'.format(*size)
+    return attrs
+
+
+def image_size(path):
+    '''Return the (width, height) of the image file or None.'''
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _image_sizes.get(path)
+    if cached is None or cached[0] != mtime:
+        size = get_image_size(path)
+        if size and not all(size):
+            size = None
+        cached = _image_sizes[path] = (mtime, size and tuple(int(v) for v in size))
+    return cached[1]
+
+
+def is_inside(path, directory):
+    ''' Returns whether the path is the directory or inside it. '''
+    path = os.path.realpath(path)
+    directory = os.path.realpath(directory)
+    return os.path.commonpath([path, directory]) == directory
+
+
 def _walk(html_dir):
     files = []
     for root, dirnames, filenames in os.walk(html_dir):
@@ -192,7 +268,7 @@ def _write_file(file_path, content):
 
 def recursive_rewrite_links(data_dict, path, root, link_elements, other_elements,
         static_host, chapter_dirs, chapter_append, yaml_append, rst_src_path,
-        lang_key=False, lang=None):
+        lang_key=False, lang=None, media=None):
     '''Rewrite links in the string values inside the data_dict.'''
     # YAML file may have a list or a dictionary in the topmost level.
     # lang_key and lang are used to pick the correct language from rst_src_path.
@@ -205,7 +281,7 @@ def recursive_rewrite_links(data_dict, path, root, link_elements, other_elements
             if isinstance(val, dict) or isinstance(val, list):
                 recursive_rewrite_links(val, path, root, link_elements,
                     other_elements, static_host, chapter_dirs, chapter_append,
-                    yaml_append, rst_src_path, key.endswith('|i18n'), lang)
+                    yaml_append, rst_src_path, key.endswith('|i18n'), lang, media)
                 # lang_key: if key is, e.g., "title|i18n", then the val dict
                 # contains keys like "en" and "fi".
             elif isinstance(val, str):
@@ -215,14 +291,14 @@ def recursive_rewrite_links(data_dict, path, root, link_elements, other_elements
                     lang_rst_src_path = rst_src_path
                 data_dict[key] = rewrite_links(val, path, root, link_elements,
                     other_elements, static_host, chapter_dirs, chapter_append,
-                    yaml_append, lang_rst_src_path)
+                    yaml_append, lang_rst_src_path, media)
 
     elif isinstance(data_dict, list):
         for i, a in enumerate(data_dict):
             if isinstance(a, dict) or isinstance(a, list):
                 recursive_rewrite_links(a, path, root, link_elements,
                     other_elements, static_host, chapter_dirs,
-                    chapter_append, yaml_append, rst_src_path, lang_key, lang)
+                    chapter_append, yaml_append, rst_src_path, lang_key, lang, media)
             elif isinstance(a, str):
                 if isinstance(rst_src_path, dict):
                     lang_rst_src_path = rst_src_path.get(lang if lang else 'en')
@@ -230,4 +306,4 @@ def recursive_rewrite_links(data_dict, path, root, link_elements, other_elements
                     lang_rst_src_path = rst_src_path
                 data_dict[i] = rewrite_links(a, path, root, link_elements,
                     other_elements, static_host, chapter_dirs,
-                    chapter_append, yaml_append, lang_rst_src_path)
+                    chapter_append, yaml_append, lang_rst_src_path, media)
@@ -0,0 +1,186 @@
+'''
+Memory tracing of the build-finished stages for the build profiler.
+
+The tracer is enabled with the config value build_profile_memory or the
+environment variable APLUS_BUILD_PROFILE_MEMORY. It also enables the
+build profiler (lib/profiler.py), whose phase() calls the functions of this
+module at the start and the end of each stage.
+
+tracemalloc is started when the build-finished event begins, so the reading
+and writing of the documents run at full speed. For each stage, the tracer
+records the peak of the traced Python allocations, the growth of the
+allocations from the start to the end of the stage, the largest allocation
+sites of the growth, and the resident set size (RSS) of the process. RSS is
+sampled in a background thread from /proc/self/statm where it is available.
+Without /proc and the resource module (Windows), RSS is not reported.
+The snapshots of the tracer are included in the traced peaks, so the peaks
+are an upper bound.
+'''
+import os
+import sys
+import threading
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+
+SAMPLE_INTERVAL = 0.05
+TOP_SITES = 10
+
+_stack = []
+_stages = {}
+_rss_peak = 0
+_sampler = None
+_stop = threading.Event()
+_filters = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+]
+
+
+def is_enabled(app):
+    value = os.environ.get('APLUS_BUILD_PROFILE_MEMORY', '')
+    return bool(app.config.build_profile_memory) or value.lower() not in ('', '0', 'false', 'no')
+
+
+def current_rss():
+    ''' Returns the resident set size of the process in bytes or None. '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss():
+    ''' Returns the peak resident set size of the process in bytes or None. '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes and macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _sample():
+    global _rss_peak
+    while not _stop.wait(SAMPLE_INTERVAL):
+        rss = current_rss()
+        if rss and rss > _rss_peak:
+            _rss_peak = rss
+
+
+def start():
+    ''' Starts tracing the allocations and sampling RSS. '''
+    global _sampler, _rss_peak
+    _stages.clear()
+    tracemalloc.start()
+    _rss_peak = current_rss() or 0
+    if _rss_peak:
+        _stop.clear()
+        _sampler = threading.Thread(target=_sample, name='aplus-memtrace', daemon=True)
+        _sampler.start()
+
+
+def stop():
+    global _sampler
+    if _sampler:
+        _stop.set()
+        _sampler.join()
+        _sampler = None
+    tracemalloc.stop()
+
+
+def enter_stage():
+    ''' Called at the start of a stage. '''
+    global _rss_peak
+    if not tracemalloc.is_tracing():
+        return
+    # The peaks are reset for the stage, so the peaks so far are kept
+    # in the enclosing stage.
+    if _stack:
+        parent = _stack[-1]
+        parent['traced_peak'] = max(parent['traced_peak'], tracemalloc.get_traced_memory()[1])
+        parent['rss_peak'] = max(parent['rss_peak'], _rss_peak)
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    rss = current_rss() or 0
+    _rss_peak = rss
+    _stack.append({
+        'snapshot': tracemalloc.take_snapshot(),
+        'traced_start': tracemalloc.get_traced_memory()[0],
+        'traced_peak': 0,
+        'rss_start': rss,
+        'rss_peak': rss,
+    })
+
+
+def exit_stage(name):
+    ''' Called at the end of a stage. '''
+    if not tracemalloc.is_tracing() or not _stack:
+        return
+    frame = _stack.pop()
+    traced, traced_peak = tracemalloc.get_traced_memory()
+    traced_peak = max(traced_peak, frame['traced_peak'])
+    rss = current_rss() or 0
+    rss_peak = max(_rss_peak, frame['rss_peak'], rss)
+    # The snapshots of the tracer itself are left out of the sites.
+    snapshot = tracemalloc.take_snapshot().filter_traces(_filters)
+    top = snapshot.compare_to(frame['snapshot'].filter_traces(_filters), 'lineno')[:TOP_SITES]
+    if _stack:
+        parent = _stack[-1]
+        parent['traced_peak'] = max(parent['traced_peak'], traced_peak)
+        parent['rss_peak'] = max(parent['rss_peak'], rss_peak)
+
+    stage = _stages.setdefault(name, {
+        'count': 0, 'traced_peak': 0, 'traced_growth': 0,
+        'rss_start': frame['rss_start'], 'rss_end': 0, 'rss_peak': 0, 'top': [],
+    })
+    stage['count'] += 1
+    stage['traced_growth'] += traced - frame['traced_start']
+    stage['rss_end'] = rss
+    stage['rss_peak'] = max(stage['rss_peak'], rss_peak)
+    if traced_peak >= stage['traced_peak']:
+        # The allocation sites of the call with the highest peak are kept.
+        stage['traced_peak'] = traced_peak
+        stage['top'] = [
+            {
+                'site': '{}:{}'.format(s.traceback[0].filename, s.traceback[0].lineno),
+                'size_diff': s.size_diff,
+                'count_diff': s.count_diff,
+            }
+            for s in top
+        ]
+
+
+def report():
+    return {
+        'max_rss': max_rss(),
+        'stages': {name: dict(stage) for name, stage in _stages.items()},
+    }
+
+
+def _mb(size):
+    return '{:.1f}'.format(size / 1048576) if size else '-'
+
+
+def format_report(memory):
+    lines = ['', 'Memory (process peak RSS {} MB)'.format(_mb(memory['max_rss']))]
+    lines.append('{:<48} {:>12} {:>12} {:>12} {:>12}'.format(
+        '', 'peak MB', 'growth MB', 'RSS peak MB', 'RSS end MB'))
+    stages = sorted(memory['stages'].items(), key=lambda item: -item[1]['traced_peak'])
+    for name, stage in stages:
+        lines.append('{:<48} {:>12} {:>12} {:>12} {:>12}'.format(
+            name[-48:], _mb(stage['traced_peak']), _mb(stage['traced_growth']),
+            _mb(stage['rss_peak']), _mb(stage['rss_end'])))
+    for name, stage in stages:
+        if stage['top']:
+            lines.append('')
+            lines.append('Largest allocation sites in {}'.format(name))
+            for site in stage['top']:
+                lines.append('  {:>10.1f} kB {:>+8d} blocks  {}'.format(
+                    site['size_diff'] / 1024, site['count_diff'], site['site'][-80:]))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,59 @@
+'''
+Records which documents use directives that need their own JavaScript and
+CSS files. The files can then be added only to the pages that need them in
+the html-page-context event instead of adding them to every page.
+
+Extensions enable the tracking with app.setup_extension('lib.page_assets').
+'''
+import os.path
+
+from sphinx.util import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def note_usage(env, name, docname=None):
+    ''' Records that the document uses the assets of the named feature. '''
+    if not hasattr(env, 'aplus_page_assets'):
+        env.aplus_page_assets = {}
+    env.aplus_page_assets.setdefault(name, set()).add(docname or env.docname)
+
+
+def is_used(env, name, docname):
+    ''' Tells whether the document uses the assets of the named feature. '''
+    return docname in getattr(env, 'aplus_page_assets', {}).get(name, ())
+
+
+def log_savings(app, name, paths, label=None):
+    ''' Logs the size of the named assets that were left out of the pages
+    that do not use them. The label is shown instead of the name. '''
+    size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+    if not size:
+        return
+    used = getattr(app.env, 'aplus_page_assets', {}).get(name, set())
+    pages = len(set(app.env.all_docs) - used)
+    logger.info('{}: {:d} bytes of CSS and JS left out of each of {:d} pages ({:d} bytes in total)'.format(
+        label or name, size, pages, size * pages))
+
+
+def purge_doc(app, env, docname):
+    for docnames in getattr(env, 'aplus_page_assets', {}).values():
+        docnames.discard(docname)
+
+
+def merge_info(app, env, docnames, other):
+    for name, other_docnames in getattr(other, 'aplus_page_assets', {}).items():
+        for docname in other_docnames & set(docnames):
+            note_usage(env, name, docname)
+
+
+def setup(app):
+    app.connect('env-purge-doc', purge_doc)
+    app.connect('env-merge-info', merge_info)
+    return {
+        # The environments of the earlier versions did not record the usage.
+        'env_version': 1,
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
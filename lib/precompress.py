@@ -0,0 +1,131 @@
+'''
+Writes precompressed .gz and .br (if the brotli module is installed) files
+next to the text files of the build so that the web server does not have to
+compress them for every request (e.g., gzip_static in nginx).
+
+The stage is enabled with the config value precompress_output. It runs at
+the end of the build after the links in the output have been rewritten.
+The hashes of the compressed files are stored in the build directory so
+that only the files that changed since the last build are compressed again.
+The YAML output is compressed too if yaml_dir is outside the build directory.
+'''
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from sphinx.util import logging
+
+import lib.profiler as profiler
+from lib.html_tools import is_inside
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = ('.html', '.js', '.css', '.svg', '.yaml')
+MANIFEST_NAME = 'precompress.json'
+
+
+def compress_build(app, exception):
+    if exception or not app.config.precompress_output:
+        return
+    with profiler.phase('precompress'):
+        _compress_build(app)
+
+
+def _compress_build(app):
+    build_dir = os.path.dirname(app.outdir)
+    manifest_path = os.path.join(build_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            old_manifest = json.load(f)
+    except (OSError, ValueError):
+        old_manifest = {}
+
+    paths = _walk(build_dir, app.config.precompress_min_size)
+    if not is_inside(app.env.yaml_dir, build_dir):
+        # The manifest lists these files relative to the build directory too.
+        paths += _walk(app.env.yaml_dir, app.config.precompress_min_size)
+    with ThreadPoolExecutor(max_workers=app.config.precompress_workers or None) as executor:
+        results = list(executor.map(
+            lambda path: compress_file(build_dir, path, old_manifest),
+            paths,
+        ))
+
+    manifest = {}
+    compressed = 0
+    for relpath, digest, changed in results:
+        manifest[relpath] = digest
+        compressed += changed
+    # Remove the compressed files of sources that were removed or that are
+    # now below the size threshold.
+    for relpath in set(old_manifest) - set(manifest):
+        for suffix in ('.gz', '.br'):
+            _remove(os.path.join(build_dir, relpath + suffix))
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    logger.info('Precompressed {:d} files ({:d} unchanged){}.'.format(
+        compressed, len(results) - compressed,
+        '' if brotli else ', install brotli for .br files'))
+
+
+def compress_file(build_dir, path, old_manifest):
+    ''' Writes the compressed files unless the source is unchanged.
+    Returns (relative path, hash, whether the files were written). '''
+    relpath = os.path.relpath(path, build_dir).replace(os.sep, '/')
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    outputs = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli:
+        outputs.append(('.br', lambda: brotli.compress(data, quality=11)))
+    if old_manifest.get(relpath) == digest and all(
+            os.path.exists(path + suffix) for suffix, _ in outputs):
+        return relpath, digest, False
+    for suffix, compress in outputs:
+        _write_atomic(path + suffix, compress())
+    return relpath, digest, True
+
+
+def _walk(build_dir, min_size):
+    paths = []
+    for root, dirnames, filenames in os.walk(build_dir):
+        for filename in filenames:
+            if filename.endswith(EXTENSIONS):
+                path = os.path.join(root, filename)
+                if os.path.getsize(path) >= min_size:
+                    paths.append(path)
+    return paths
+
+
+def _write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def setup(app):
+    app.add_config_value('precompress_output', False, 'html')
+    app.add_config_value('precompress_min_size', 1024, 'html')
+    app.add_config_value('precompress_workers', None, 'html')
+    # Run after the other build-finished handlers have written the output.
+    app.connect('build-finished', compress_build, priority=900)
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,71 @@
+'''
+Reads the exercise config files before the documents are parsed.
+
+The submit and ae-output directives read their :config: files while the
+documents are parsed, one file at a time. On a network file system, each read
+stalls the parsing. If the config value prefetch_configs is set, the sources
+of the documents that will be read are scanned for :config: options before
+the reading starts, and the config files are read in a thread pool into the
+cache of yaml_writer.read_config. The directives then get the parsed files
+from the cache.
+'''
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from sphinx.util import logging
+
+import lib.profiler as profiler
+import lib.yaml_writer as yaml_writer
+
+
+logger = logging.getLogger(__name__)
+
+CONFIG_OPTION = re.compile(r'^[ \t]+:config:[ \t]*(\S+)[ \t]*$', re.MULTILINE)
+
+
+def prefetch(app, env, docnames):
+    if not app.config.prefetch_configs or not docnames:
+        return
+    with profiler.phase('prefetch'):
+        _prefetch(app, env, docnames)
+
+
+def _prefetch(app, env, docnames):
+    with ThreadPoolExecutor(max_workers=app.config.prefetch_workers or None) as executor:
+        paths = set()
+        for found in executor.map(lambda docname: config_paths(env.doc2path(docname)), docnames):
+            paths.update(os.path.join(app.srcdir, path) for path in found)
+        results = list(executor.map(read_config, sorted(paths)))
+    failed = results.count(False)
+    logger.info('Prefetched {:d} config files, {:d} could not be read.'.format(
+        len(results) - failed, failed))
+
+
+def config_paths(source_path):
+    ''' Returns the :config: options in the source file. '''
+    try:
+        with open(source_path, encoding='utf-8-sig') as f:
+            return CONFIG_OPTION.findall(f.read())
+    except (OSError, UnicodeError):
+        return []
+
+
+def read_config(path):
+    ''' Reads the config file into the cache. The errors are reported when
+    the directive reads the file. '''
+    try:
+        yaml_writer.read_config(path)
+        return True
+    except Exception:
+        return False
+
+
+def setup(app):
+    app.add_config_value('prefetch_configs', False, '')
+    app.add_config_value('prefetch_workers', None, '')
+    app.connect('env-before-read-docs', prefetch)
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,301 @@
+'''
+Build profiler for finding out where the build time of a course goes.
+
+The profiler is enabled with the config value build_profile or the
+environment variable APLUS_BUILD_PROFILE (any value except "", "0" or
+"false"). It records:
+
+* the wall and CPU time of the run() method of each directive per document.
+  Both the inclusive time and the self time without nested directives are
+  recorded,
+* the time in aplus_nodes.visit_html and depart_html,
+* the time of the build phases that are wrapped with phase() or timed(),
+  such as toc_config.write, toc_languages.join and html_tools.rewrite_outdir,
+* the number and size of the YAML files read and written,
+* the memory use of the build-finished stages if build_profile_memory or
+  the environment variable APLUS_BUILD_PROFILE_MEMORY is set
+  (see lib/memtrace.py).
+
+At the end of the build, the report is written into _build/profile.json and
+a table of the top build_profile_top entries into _build/profile.txt and
+the build log.
+
+Directive timings are stored in the environment per document so that they
+survive parallel reading. The timings of parallel writing are not collected.
+'''
+import functools
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from docutils.parsers.rst import directives
+from sphinx.util import logging
+
+import lib.memtrace as memtrace
+
+
+logger = logging.getLogger(__name__)
+
+_active = False
+_memory = False
+_env = None
+_stack = []
+_stats = {}
+
+
+def is_enabled(app):
+    value = os.environ.get('APLUS_BUILD_PROFILE', '')
+    return bool(app.config.build_profile) or value.lower() not in ('', '0', 'false', 'no')
+
+
+def _empty_stats():
+    return {'phases': {}, 'yaml': {'read': [0, 0], 'write': [0, 0]}}
+
+
+def _add_time(table, name, wall, self_wall, cpu):
+    entry = table.setdefault(name, [0, 0.0, 0.0, 0.0])
+    entry[0] += 1
+    entry[1] += wall
+    entry[2] += self_wall
+    entry[3] += cpu
+
+
+@contextmanager
+def phase(name):
+    ''' Records the time of the enclosed block under the name. '''
+    if not _active:
+        yield
+        return
+    if _memory:
+        memtrace.enter_stage()
+    _stack.append(0.0)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        child = _stack.pop()
+        if _stack:
+            _stack[-1] += wall
+        _add_time(_stats['phases'], name, wall, wall - child, cpu)
+        if _memory:
+            memtrace.exit_stage(name)
+
+
+def timed(name, func):
+    ''' Wraps the function so that its calls are recorded under the name. '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _active:
+            return func(*args, **kwargs)
+        with phase(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def note_yaml(operation, size):
+    ''' Records a YAML file read or write of the size in bytes. '''
+    if not _active:
+        return
+    docname = _env.temp_data.get('docname') if _env is not None else None
+    if docname:
+        stats = _env.aplus_profile.setdefault(docname, _empty_doc_stats())
+    else:
+        stats = _stats
+    counts = stats['yaml'][operation]
+    counts[0] += 1
+    counts[1] += size
+
+
+def _empty_doc_stats():
+    return {'directives': {}, 'yaml': {'read': [0, 0], 'write': [0, 0]}}
+
+
+def _timed_run(run):
+    @functools.wraps(run)
+    def wrapper(self):
+        if not _active or getattr(self, '_aplus_profiled', False):
+            # A run() method that calls the run() of its base class is
+            # recorded only once.
+            return run(self)
+        self._aplus_profiled = True
+        env = self.state.document.settings.env
+        _stack.append(0.0)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            return run(self)
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            child = _stack.pop()
+            if _stack:
+                _stack[-1] += wall
+            self._aplus_profiled = False
+            stats = env.aplus_profile.setdefault(env.docname, _empty_doc_stats())
+            _add_time(stats['directives'], self.name, wall, wall - child, cpu)
+    wrapper._aplus_profiler = True
+    return wrapper
+
+
+def install(app):
+    ''' Instruments the directives and node visitors if profiling is enabled. '''
+    # Imported here because aplus_nodes imports this module via yaml_writer.
+    import aplus_nodes
+
+    global _active, _memory, _stats
+    _memory = memtrace.is_enabled(app)
+    _active = is_enabled(app) or _memory
+    if not _active:
+        return
+    _stats = _empty_stats()
+    _stats['started'] = time.perf_counter()
+
+    # Directives that the extensions have registered.
+    for cls in set(directives._directives.values()):
+        for klass in cls.__mro__:
+            run = klass.__dict__.get('run')
+            if run and not getattr(run, '_aplus_profiler', False):
+                klass.run = _timed_run(run)
+
+    # The translator copies the handlers from the registry for each document.
+    for handlers in app.registry.translation_handlers.values():
+        for name, (visit, depart) in list(handlers.items()):
+            if visit is aplus_nodes.visit_html:
+                handlers[name] = (
+                    timed('aplus_nodes.visit_html', visit),
+                    timed('aplus_nodes.depart_html', depart),
+                )
+    if app.parallel > 1:
+        logger.info('Build profiler: the node visitor times are not collected from parallel writing.')
+
+
+def reset_read_stats(app, env, docnames):
+    global _env
+    if not _active:
+        # The report of the previous build has been written. A warm build of
+        # the same application (watch.py, build_server.py) is profiled again.
+        install(app)
+    if not _active:
+        return
+    _env = env
+    env.aplus_profile = {}
+
+
+def merge_info(app, env, docnames, other):
+    if not _active:
+        return
+    # Later worker processes inherit the stats merged so far, so only the
+    # documents read by this worker are taken.
+    for docname in docnames:
+        if docname in getattr(other, 'aplus_profile', {}):
+            env.aplus_profile[docname] = other.aplus_profile[docname]
+
+
+def start_memory_trace(app, exception):
+    if _memory and not exception:
+        memtrace.start()
+
+
+def write_report(app, exception):
+    global _active
+    if not _active:
+        return
+    if _memory:
+        memtrace.stop()
+    if exception:
+        return
+    _active = False
+    report = make_report(app)
+    build_dir = os.path.dirname(app.outdir)
+    with open(os.path.join(build_dir, 'profile.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    table = format_report(report, app.config.build_profile_top)
+    with open(os.path.join(build_dir, 'profile.txt'), 'w', encoding='utf-8') as f:
+        f.write(table)
+    logger.info(table)
+    logger.info('Build profile written into {}.'.format(os.path.join(build_dir, 'profile.json')))
+
+
+def _times(entry):
+    return {
+        'count': entry[0],
+        'wall': round(entry[1], 6),
+        'self_wall': round(entry[2], 6),
+        'cpu': round(entry[3], 6),
+    }
+
+
+def make_report(app):
+    documents = getattr(app.env, 'aplus_profile', {})
+    directive_totals = {}
+    yaml_totals = {op: list(counts) for op, counts in _stats['yaml'].items()}
+    for stats in documents.values():
+        for name, entry in stats['directives'].items():
+            total = directive_totals.setdefault(name, [0, 0.0, 0.0, 0.0])
+            for i, value in enumerate(entry):
+                total[i] += value
+        for op, counts in stats['yaml'].items():
+            yaml_totals[op][0] += counts[0]
+            yaml_totals[op][1] += counts[1]
+    report = {
+        'total_wall': round(time.perf_counter() - _stats['started'], 6),
+        'phases': {name: _times(entry) for name, entry in _stats['phases'].items()},
+        'directives': {name: _times(entry) for name, entry in directive_totals.items()},
+        'documents': {
+            docname: {
+                'directives': {name: _times(entry) for name, entry in stats['directives'].items()},
+                'yaml': {op: {'count': c[0], 'bytes': c[1]} for op, c in stats['yaml'].items()},
+            }
+            for docname, stats in documents.items()
+        },
+        'yaml': {op: {'count': c[0], 'bytes': c[1]} for op, c in yaml_totals.items()},
+    }
+    if _memory:
+        report['memory'] = memtrace.report()
+    return report
+
+
+def format_report(report, top):
+    lines = ['Build profile (total {:.3f} s)'.format(report['total_wall'])]
+
+    def table(title, rows):
+        lines.append('')
+        lines.append(title)
+        lines.append('{:<48} {:>7} {:>10} {:>10} {:>10}'.format('', 'count', 'wall s', 'self s', 'cpu s'))
+        for name, t in rows[:top]:
+            lines.append('{:<48} {:>7d} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                name[-48:], t['count'], t['wall'], t['self_wall'], t['cpu']))
+
+    by_self = lambda item: -item[1]['self_wall']
+    table('Build phases', sorted(report['phases'].items(), key=by_self))
+    table('Directives', sorted(report['directives'].items(), key=by_self))
+    documents = []
+    for docname, stats in report['documents'].items():
+        for name, t in stats['directives'].items():
+            documents.append(('{} [{}]'.format(docname, name), t))
+    table('Directives per document', sorted(documents, key=by_self))
+
+    lines.append('')
+    for op, counts in sorted(report['yaml'].items()):
+        lines.append('YAML {}: {:d} files, {:d} bytes'.format(op, counts['count'], counts['bytes']))
+    text = '\n'.join(lines) + '\n'
+    if 'memory' in report:
+        text += memtrace.format_report(report['memory'])
+    return text
+
+
+def setup(app):
+    app.add_config_value('build_profile', False, 'html')
+    app.add_config_value('build_profile_top', 20, 'html')
+    app.add_config_value('build_profile_memory', False, 'html')
+    app.connect('builder-inited', install)
+    # Before the other handlers, e.g., the prefetch phase.
+    app.connect('env-before-read-docs', reset_read_stats, priority=100)
+    app.connect('env-merge-info', merge_info)
+    # Memory is traced from the start of the build-finished event.
+    app.connect('build-finished', start_memory_trace, priority=1)
+    app.connect('build-finished', write_report, priority=999)
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,276 @@
+'''
+Sharded builds: each build includes only some modules of the course and
+the partial builds are merged afterwards (merge_shards.py).
+
+The config value build_modules lists the toctree entries of the master
+document that the build includes, e.g., ['module01/index', 'module02/index'],
+or on the command line: sphinx-build -D build_modules=module01/index,module02/index
+The other toctree entries are excluded from the build together with their
+directories. The YAML files of a shard are written into the yaml directory
+next to its HTML output (shard1/_build/yaml for shard1/_build/html) unless
+yaml_dir is set.
+
+A shard build writes the index and the exercise YAML files of its modules,
+but it does not rewrite the links of the output, because the links to
+chapters are recognized by the module keys of the whole course. Instead, the
+settings of the rewriting are saved into _build/yaml/_shard.yaml. The merge
+combines the indexes with the keyed merge of append_content
+(toc_config.merge_config), orders the modules like the master toctree and
+rewrites the links of the merged output once.
+
+The :doc: links to the documents of the other shards are resolved to the URLs
+of the documents, but the titles of the documents are not known in the shard,
+so such links should have an explicit title. The :ref: links to the labels of
+the other shards can not be resolved. The previous and next links of the
+first and the last chapters of a shard do not cross to the other shards. The
+pages outside the modules, such as the master document, the search and the
+general index, list only the modules of one shard. Otherwise, the merged
+output is the same as the output of a build of the whole course.
+
+In a multilingual course, the toctree entries of the master document are the
+language trees (index_en, index_fi, ...). language_build.py builds each of
+them as a shard and merge_languages() joins the language versions with
+toc_languages.join like a build of the whole course does.
+'''
+import copy
+import os
+import re
+import shutil
+import types
+
+from docutils import nodes
+from sphinx.util import docname_join, logging
+
+import lib.yaml_writer as yaml_writer
+
+
+logger = logging.getLogger(__name__)
+
+SHARD_FILE = '_shard.yaml'
+TOCTREE = re.compile(r'^(?P<indent>[ \t]*)\.\.[ \t]+toctree::')
+EXPLICIT_TITLE = re.compile(r'^.+?\s*<(.*?)>$')
+
+
+def is_shard(config):
+    return bool(config.build_modules)
+
+
+def module_key(docname):
+    ''' The module key that toc_config.make_index gives to the toctree entry. '''
+    return docname if '/' not in docname else '_'.join(docname.split('/')[:-1])
+
+
+def source_suffixes(config):
+    ''' The source suffixes before Sphinx has converted the setting. '''
+    suffix = config.source_suffix
+    return [suffix] if isinstance(suffix, str) else list(suffix)
+
+
+def master_toctree_entries(srcdir, config):
+    ''' Reads the toctree entries of the master document from the source. '''
+    path = None
+    for suffix in source_suffixes(config):
+        candidate = os.path.join(srcdir, config.master_doc + suffix)
+        if os.path.isfile(candidate):
+            path = candidate
+            break
+    if path is None:
+        return []
+    with open(path, encoding='utf-8-sig') as f:
+        lines = f.read().splitlines()
+
+    entries = []
+    indent = None
+    for line in lines:
+        m = TOCTREE.match(line)
+        if m:
+            indent = len(m.group('indent'))
+            continue
+        if indent is None or not line.strip():
+            continue
+        if len(line) - len(line.lstrip()) <= indent:
+            indent = None
+            continue
+        entry = line.strip()
+        if entry.startswith(':'):
+            continue
+        m = EXPLICIT_TITLE.match(entry)
+        if m:
+            entry = m.group(1)
+        entries.append(docname_join(config.master_doc, entry))
+    return entries
+
+
+def exclude_other_modules(app, config):
+    ''' Excludes the toctree entries of the master document that are not
+    in build_modules. '''
+    if not is_shard(config):
+        return
+    selected = set(module.rstrip('/') for module in config.build_modules)
+    entries = master_toctree_entries(app.srcdir, config)
+    included = [e for e in entries if e in selected or module_key(e) in selected]
+    if not included:
+        logger.warning('None of build_modules is in the toctree of {}: {}'.format(
+            config.master_doc, ', '.join(sorted(selected))))
+    included_dirs = set(os.path.dirname(e) for e in included)
+    patterns = []
+    for entry in entries:
+        if entry in included:
+            continue
+        directory = os.path.dirname(entry)
+        if directory and directory not in included_dirs:
+            patterns.append(directory + '/**')
+        else:
+            patterns.extend(entry + suffix for suffix in source_suffixes(config))
+        lang = re.search(r'_([a-z]{2})$', entry)
+        if lang:
+            # The entry is the tree of another language. Its documents have
+            # the same language suffix or directory (see
+            # toc_config.set_config_language_for_doc).
+            patterns.extend('**_' + lang.group(1) + suffix for suffix in source_suffixes(config))
+            patterns.append('**/' + lang.group(1) + '/**')
+    config.exclude_patterns = list(config.exclude_patterns) + patterns
+    config.suppress_warnings = list(config.suppress_warnings) + ['toc.excluded']
+
+
+def resolve_excluded_doc(app, env, node, contnode):
+    ''' Resolves a :doc: link to a document of another shard. '''
+    if not is_shard(app.config) or node.get('reftype') != 'doc':
+        return None
+    target = docname_join(node.get('refdoc', ''), node['reftarget'])
+    if target in env.all_docs or not os.path.isfile(env.doc2path(target)):
+        return None
+    # The same nodes as for the documents of the shard, but without the title.
+    text = contnode.astext()
+    reference = nodes.reference('', '', internal=True)
+    reference['refuri'] = app.builder.get_relative_uri(node['refdoc'], target)
+    reference.append(nodes.inline(text, text, classes=['doc']))
+    return reference
+
+
+def write_info(app, index):
+    ''' Saves what the merge needs to know about the shard. '''
+    yaml_writer.write(yaml_writer.file_path(app.env, SHARD_FILE), {
+        'modules': [module['key'] for module in index['modules']],
+        'module_order': [module_key(e) for e in master_toctree_entries(app.srcdir, app.config)],
+        'static_host': app.config.static_host,
+        'lazy_load_media': app.config.lazy_load_media,
+        'add_image_sizes': app.config.add_image_sizes,
+        'index_fingerprints': app.config.index_fingerprints,
+        'index_defaults': app.config.index_defaults,
+        'confdir': app.confdir,
+        # The settings of joining the language versions.
+        'skip_language_inconsistencies': app.config.skip_language_inconsistencies,
+        'override': app.config.override,
+        'append_content': [os.path.abspath(path) for path in app.config.append_content],
+    })
+
+
+def merge(output, shards):
+    ''' Merges the shard build directories (_build) into the output
+    build directory. '''
+    # Imported here because toc_config imports this module.
+    import toc_config
+
+    output = os.path.abspath(output)
+    infos = []
+    index = None
+    for shard in shards:
+        infos.append(_copy_shard(shard, output))
+        shard_index = yaml_writer.read(os.path.join(shard, 'yaml', 'index.yaml'))
+        if index is None:
+            index = copy.deepcopy(shard_index)
+        else:
+            # The course settings and the categories are the same in every
+            # shard, so equal entries are not appended again.
+            toc_config.merge_config(index, shard_index, skip_equal=True)
+
+    order = infos[0]['module_order']
+    position = {key: i for i, key in enumerate(order)}
+    index['modules'].sort(key=lambda module: position.get(module['key'], len(order)))
+    _finish(output, index, infos[0])
+    return index
+
+
+def merge_languages(output, builds):
+    ''' Joins the builds of the language trees, a list of (language,
+    build directory) in the order of the language toctree. '''
+    import toc_config
+    import lib.toc_languages as toc_languages
+
+    output = os.path.abspath(output)
+    info = [_copy_shard(build, output) for lang, build in builds][0]
+    yaml_dir = os.path.join(output, 'yaml')
+    indexes = [
+        (lang, yaml_writer.read(os.path.join(yaml_dir, 'index_' + lang + '.yaml')))
+        for lang, build in builds
+    ]
+    for lang, index in indexes:
+        _set_static_dir(output, index, info)
+        yaml_writer.write(os.path.join(yaml_dir, 'index_' + lang + '.yaml'), index)
+    # The joiner reads the settings and the exercise YAML files through app.
+    config = types.SimpleNamespace(
+        skip_language_inconsistencies=info['skip_language_inconsistencies'],
+        override=info['override'],
+        append_content=info['append_content'],
+    )
+    app = types.SimpleNamespace(config=config, env=types.SimpleNamespace(config=config, yaml_dir=yaml_dir))
+    index = toc_languages.join(app, indexes)
+    toc_config.append_manual_content(app, index)
+    _finish(output, index, info)
+    return index
+
+
+def _copy_shard(shard, output):
+    info = yaml_writer.read(os.path.join(shard, 'yaml', SHARD_FILE))
+    for directory in ('html', 'yaml'):
+        _copy_tree(os.path.join(shard, directory), os.path.join(output, directory))
+    return info
+
+
+def _finish(output, index, info):
+    ''' Writes the index and rewrites the links like toc_config.write. '''
+    import toc_config
+    import lib.html_tools as html_tools
+    _set_static_dir(output, index, info)
+    if info.get('index_defaults'):
+        toc_config.add_category_defaults(index)
+    yaml_writer.write(os.path.join(output, 'yaml', 'index.yaml'), index)
+    os.remove(os.path.join(output, 'yaml', SHARD_FILE))
+    keys = set(module['key'] for module in index['modules']) | {'toc', 'user', 'account'}
+    html_tools.rewrite_outdir(os.path.join(output, 'html'), keys, info['static_host'],
+        info['lazy_load_media'], info['add_image_sizes'])
+    if info.get('index_fingerprints'):
+        toc_config.add_fingerprints(os.path.join(output, 'yaml', 'index.yaml'),
+            os.path.join(output, 'html'), os.path.join(output, 'yaml'))
+
+
+def _set_static_dir(output, index, info):
+    ''' The static_dir of the index is the output directory of the shard
+    build. It is changed to the merged output in the course directory. '''
+    html_dir = os.path.join(output, 'html')
+    if 'static_dir' in index and html_dir.startswith(os.path.join(info['confdir'], '')):
+        index['static_dir'] = os.path.relpath(html_dir, info['confdir']).replace(os.sep, '/')
+
+
+def _copy_tree(source, target):
+    for root, dirnames, filenames in os.walk(source):
+        # The doctrees of sphinx-build without -M are not a part of the output.
+        dirnames[:] = [d for d in dirnames if d != '.doctrees']
+        directory = os.path.join(target, os.path.relpath(root, source))
+        os.makedirs(directory, exist_ok=True)
+        for filename in filenames:
+            # The precompressed files would not match the rewritten files.
+            if filename.endswith(('.gz', '.br')):
+                continue
+            shutil.copy2(os.path.join(root, filename), os.path.join(directory, filename))
+
+
+def setup(app):
+    app.add_config_value('build_modules', [], 'env')
+    app.connect('config-inited', exclude_other_modules)
+    app.connect('missing-reference', resolve_excluded_doc)
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,293 @@
+'''
+Self-hosted and bundled assets for the aplus themes.
+
+When the theme option bundle_assets is set, the third-party files that the
+theme layout loads from public CDNs are downloaded once into a local cache
+directory (config value vendor_assets_dir) and served from _static. The local
+CSS and JS files of each page are concatenated and minified into bundles.
+All bundles are written to _static/bundles and named by their content hash
+so that they can be served with immutable cache headers.
+
+The cache directory can be committed to the course repository so that the
+course can be built without network access. If a file can not be downloaded
+and it is not in the cache, the page keeps loading it from the CDN.
+
+Sphinx highlights the code blocks with Pygments, so the theme option
+skip_highlightjs (on by default) leaves highlight.js out of the pages that
+do not include code in raw HTML.
+'''
+import base64
+import hashlib
+import io
+import os
+import re
+import urllib.request
+
+from docutils import nodes
+from sphinx.builders.html import JavaScript, Stylesheet
+from sphinx.util import logging
+from sphinx.util.osutil import ensuredir
+
+from lib import page_assets
+
+
+logger = logging.getLogger(__name__)
+
+# Third-party files that the theme layout loads from public CDNs:
+# (group, extension, URL, subresource integrity hash or None)
+VENDOR_FILES = [
+    ('base', 'js', 'https://code.jquery.com/jquery-3.6.0.min.js',
+        'sha256-/xUj+3OJU5yExlq6GSYGSHk7tPXikynS7ogEvDej/m4='),
+    ('highlight', 'js', 'https://cdnjs.cloudflare.com/ajax/libs/highlight.js/8.6/highlight.min.js', None),
+    ('highlight', 'css', 'https://cdnjs.cloudflare.com/ajax/libs/highlight.js/8.7/styles/github.min.css', None),
+]
+
+BUNDLE_DIR = '_static/bundles'
+
+# Raw HTML that contains code blocks that Pygments did not highlight.
+raw_code_pattern = re.compile(r'<pre[\s>]|<code[\s>]', re.IGNORECASE)
+
+# Local files are referenced relative to their own location.
+css_relative_reference = re.compile(r'@import|url\(\s*[\'"]?(?!data:|https?:|/)', re.IGNORECASE)
+css_tokens = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|(/\*.*?\*/)|(\s+)', re.DOTALL)
+css_punctuation_space = re.compile(r' ?([{};>]) ?')
+
+_bundles = {}
+
+
+def tobool(value):
+    ''' Same as the tobool filter of the Sphinx templates. '''
+    if isinstance(value, str):
+        return value.lower() in ('true', '1', 'yes', 'on')
+    return bool(value)
+
+
+def theme_option(app, name, default=False):
+    if app.builder.format != 'html' or not hasattr(app.builder, 'theme'):
+        return default
+    options = app.builder.theme.get_options(app.builder.theme_options)
+    return tobool(options.get(name, default))
+
+
+def is_enabled(app):
+    return theme_option(app, 'bundle_assets')
+
+
+def prepare_vendor_files(app):
+    ''' Downloads the third-party files unless they have been cached and
+    writes them into vendor bundles. '''
+    if not is_enabled(app):
+        return
+    cache_dir = os.path.join(app.confdir, app.config.vendor_assets_dir)
+    # The files are bundled by group so that highlight.js can be left out.
+    vendor = {}
+    for group, ext in sorted(set((group, ext) for group, ext, _, _ in VENDOR_FILES)):
+        contents = []
+        remote = []
+        for url, integrity in ((f[2], f[3]) for f in VENDOR_FILES if f[:2] == (group, ext)):
+            content = _cached_download(cache_dir, url, integrity)
+            if content is None:
+                remote.append(url)
+            else:
+                contents.append(content)
+        files = vendor.setdefault(group, {}).setdefault(ext, [])
+        if contents:
+            joiner = ';\n' if ext == 'js' else '\n'
+            files.append(_write_bundle(app, 'vendor-' + group, ext, joiner.join(contents)))
+        files.extend(remote)
+    app.builder.aplus_vendor_files = vendor
+
+
+def _cached_download(cache_dir, url, integrity):
+    path = os.path.join(cache_dir, url.split('://', 1)[1])
+    if not os.path.exists(path):
+        logger.info('Downloading {} into {}'.format(url, cache_dir))
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                data = response.read()
+        except OSError as e:
+            logger.warning('Could not download {}, loading it from the CDN instead: {}'.format(url, e))
+            return None
+        if integrity:
+            algorithm, expected = integrity.split('-', 1)
+            digest = base64.b64encode(hashlib.new(algorithm, data).digest()).decode('ascii')
+            if digest != expected:
+                logger.warning('Integrity check failed for {}, loading it from the CDN instead'.format(url))
+                return None
+        ensuredir(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+    with io.open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def note_client_highlighting(app, doctree):
+    ''' Records the documents that include code in raw HTML. Pygments has
+    highlighted all the other code blocks already. '''
+    for node in doctree.traverse(nodes.raw):
+        if 'html' in node.get('format', '').split() and raw_code_pattern.search(node.astext()):
+            page_assets.note_usage(app.env, 'highlightjs')
+            return
+
+
+def update_highlight_context(app, pagename, templatename, context, doctree):
+    ''' Tells the layout whether the page needs highlight.js. '''
+    context['aplus_client_highlighting'] = (
+        not theme_option(app, 'skip_highlightjs', True)
+        or page_assets.is_used(app.env, 'highlightjs', pagename)
+    )
+
+
+def bundle_page_assets(app, pagename, templatename, context, doctree):
+    ''' Replaces the local CSS and JS files of the page with bundles. '''
+    if not is_enabled(app):
+        return
+    context['aplus_vendor_files'] = getattr(app.builder, 'aplus_vendor_files', None)
+
+    # The theme stylesheet is placed before the other CSS files.
+    css_files = sorted(context.get('css_files', []), key=lambda css: css.priority)
+    style = context.get('style')
+    if style and not isinstance(style, (list, tuple)):
+        css_files.insert(0, Stylesheet('_static/' + style, priority=0, rel='stylesheet', type='text/css',
+            **{'data-aplus': 'yes'}))
+        context['style'] = None
+    context['css_files'] = _bundle_files(app, css_files, 'css', Stylesheet)
+
+    js_files = sorted(context.get('script_files', []), key=lambda js: js.priority)
+    context['script_files'] = _bundle_files(app, js_files, 'js', JavaScript)
+
+
+def _bundle_files(app, files, ext, cls):
+    # Consecutive local files with the same attributes are bundled together.
+    # Inline and asynchronous scripts are kept in their place.
+    result = []
+    run = []
+
+    def flush():
+        if run:
+            sources = [source for _, source in run]
+            bundle = _get_bundle(app, sources, ext)
+            first = run[0][0]
+            result.append(cls(bundle, priority=first.priority, **_bundle_attributes(first)))
+        run.clear()
+
+    for item in files:
+        source = _bundleable_source(app, item, ext)
+        if source and run and _bundle_attributes(run[0][0]) != _bundle_attributes(item):
+            flush()
+        if source:
+            run.append((item, source))
+        else:
+            flush()
+            result.append(item)
+    flush()
+    return result
+
+
+def _bundle_attributes(item):
+    return {k: v for k, v in item.attributes.items() if k not in ('href', 'src')}
+
+
+def _bundleable_source(app, item, ext):
+    filename = getattr(item, 'filename', None)
+    attributes = getattr(item, 'attributes', {})
+    if not filename or '://' in filename or filename.startswith('//'):
+        return None
+    if attributes.get('body') or 'async' in attributes or 'defer' in attributes:
+        return None
+    if ext == 'css' and attributes.get('rel', 'stylesheet') != 'stylesheet':
+        return None
+    source = _find_static_source(app, filename)
+    if ext == 'css' and source:
+        with io.open(source, 'r', encoding='utf-8') as f:
+            if css_relative_reference.search(f.read()):
+                return None
+    return source
+
+
+def _find_static_source(app, filename):
+    ''' Finds the source file that Sphinx or the extensions copy to the
+    given _static path. The last copied file wins. '''
+    if filename.startswith('_static/'):
+        filename = filename[len('_static/'):]
+    # The directive extensions copy their own files at the end of the build.
+    candidates = [os.path.join(os.path.dirname(os.path.dirname(__file__)), 'directives', 'static')]
+    candidates.extend(
+        os.path.join(app.confdir, path) for path in reversed(app.config.html_static_path)
+    )
+    candidates.extend(
+        os.path.join(path, 'static') for path in app.builder.theme.get_theme_dirs()
+    )
+    for directory in candidates:
+        path = os.path.join(directory, filename)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _get_bundle(app, sources, ext):
+    # The same process may build several courses (build_server.py) or the
+    # output may have been removed (watch.py), so the bundle must exist in
+    # the current output directory.
+    key = (app.outdir,) + tuple((path, os.path.getmtime(path)) for path in sources)
+    if key not in _bundles or not os.path.exists(os.path.join(app.outdir, _bundles[key])):
+        contents = []
+        for path in sources:
+            with io.open(path, 'r', encoding='utf-8') as f:
+                contents.append(minify_css(f.read()) if ext == 'css' else minify_js(f.read()))
+        joiner = ';\n' if ext == 'js' else '\n'
+        _bundles[key] = _write_bundle(app, 'aplus', ext, joiner.join(contents))
+    return _bundles[key]
+
+
+def _write_bundle(app, name, ext, content):
+    data = content.encode('utf-8')
+    filename = '{}/{}.{}.{}'.format(BUNDLE_DIR, name, hashlib.sha256(data).hexdigest()[:16], ext)
+    path = os.path.join(app.outdir, filename)
+    if not os.path.exists(path):
+        ensuredir(os.path.dirname(path))
+        # Parallel writers may create the same bundle.
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return filename
+
+
+def minify_css(content):
+    ''' Removes comments and unnecessary whitespace outside strings. '''
+    def replace(match):
+        if match.group(1):
+            return match.group(1)
+        if match.group(2):
+            return ''
+        return ' '
+    parts = css_tokens.sub(replace, content)
+    # Strings are protected from the second pass by splitting them out.
+    pieces = re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', parts)
+    for i in range(0, len(pieces), 2):
+        pieces[i] = css_punctuation_space.sub(r'\1', pieces[i])
+    return ''.join(pieces).strip()
+
+
+def minify_js(content):
+    ''' Minifies JavaScript with rjsmin if it is installed. '''
+    try:
+        import rjsmin
+    except ImportError:
+        return content
+    return rjsmin.jsmin(content)
+
+
+def setup(app):
+    app.setup_extension('lib.page_assets')
+    app.add_config_value('vendor_assets_dir', '_vendor', 'html')
+    app.connect('builder-inited', prepare_vendor_files)
+    app.connect('doctree-read', note_client_highlighting)
+    app.connect('html-page-context', update_highlight_context)
+    # Run after the extensions have added their files to the page.
+    app.connect('html-page-context', bundle_page_assets, priority=900)
+    return {
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -170,13 +170,14 @@ class IndexJoiner:
                         self.raise_unequal(c_path, lang2, 'configure.url')
                     else:
                         configure = c2.get(k, v).copy()
-                        files = configure.get('files')
-                        if files:
-                            files = files.copy()
-                            files.update(v.get('files', {}))
-                            configure['files'] = files
-                        else:
-                            configure['files'] = v.get('files', {})
+                        for files_key in ('files', 'file_hashes'):
+                            files = configure.get(files_key)
+                            if files:
+                                files = files.copy()
+                                files.update(v.get(files_key, {}))
+                                configure[files_key] = files
+                            elif files_key in v or files_key == 'files':
+                                configure[files_key] = v.get(files_key, {})
                         c[k] = configure
                 elif deep_equals(v, c2.get(k, v)):
                     c[k] = v
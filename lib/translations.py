@@ -58,6 +58,11 @@ translations = {
         'fi': 'en osaa sanoa / en kommentoi',
         #'sv': 'jag kan inte säga / ingen kommentar',
     },
+    'play_video': {
+        'en': 'Play video',
+        'fi': 'Toista video',
+        #'sv': 'Spela upp videon',
+    },
 }
 
 
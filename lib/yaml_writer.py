@@ -1,13 +1,27 @@
+import copy
 import io
 import os.path
 
 import yaml
 from sphinx.util.osutil import ensuredir
 
+import lib.profiler as profiler
+
+# The exercise config files that have been read: path -> ((mtime, size), data)
+_configs = {}
+
 
 def create_directory(app):
     ''' Creates the yaml directory if necessary '''
-    app.env.yaml_dir = os.path.join(app.builder.confdir, '_build', 'yaml')
+    if app.config.yaml_dir:
+        yaml_dir = os.path.join(app.builder.confdir, app.config.yaml_dir)
+    elif app.config.build_modules:
+        # Each shard build writes the YAML next to its HTML output, so that
+        # the shards do not overwrite each other (see lib/shards.py).
+        yaml_dir = os.path.join(os.path.dirname(app.outdir), 'yaml')
+    else:
+        yaml_dir = os.path.join(app.builder.confdir, '_build', 'yaml')
+    app.env.yaml_dir = yaml_dir
     ensuredir(app.env.yaml_dir)
 
 
@@ -20,18 +34,41 @@ def file_path(env, name):
 
 
 def write(file_path, data_dict):
-    ''' Writes dictionary into a yaml file '''
-    with io.open(file_path, 'w', encoding='utf-8') as f:
-        out = yaml.safe_dump(
-            data_dict,
-            default_flow_style=False,
-            allow_unicode=True
-        )
-        f.write(out.decode('utf-8') if hasattr(out, 'decode') else out)
+    ''' Writes dictionary into a yaml file unless the file
+    already has the same content '''
+    out = yaml.safe_dump(
+        data_dict,
+        default_flow_style=False,
+        allow_unicode=True
+    )
+    out = out.decode('utf-8') if hasattr(out, 'decode') else out
+    try:
+        with io.open(file_path, 'r', encoding='utf-8') as f:
+            unchanged = f.read() == out
+    except (OSError, UnicodeError):
+        unchanged = False
+    if not unchanged:
+        with io.open(file_path, 'w', encoding='utf-8') as f:
+            f.write(out)
+    profiler.note_yaml('write', len(out.encode('utf-8')))
 
 
 def read(file_path):
     ''' Reads dictionary from a yaml file '''
     with io.open(file_path, 'r', encoding='utf-8') as f:
-        return yaml.safe_load(f.read())
+        content = f.read()
+    profiler.note_yaml('read', len(content.encode('utf-8')))
+    return yaml.safe_load(content)
+
 
+def read_config(file_path):
+    ''' Reads an exercise config file. The parsed files are cached by the
+    modification time and the size, so the directives of all the languages
+    share one read. Each call returns its own copy of the data. '''
+    file_path = os.path.abspath(file_path)
+    st = os.stat(file_path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _configs.get(file_path)
+    if cached is None or cached[0] != stamp:
+        cached = _configs[file_path] = (stamp, read(file_path))
+    return copy.deepcopy(cached[1])
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+'''
+Merges the outputs of sharded builds into the output of the whole course.
+
+Each shard is the _build directory of a build with the build_modules setting
+(see lib/shards.py). A shard build writes its YAML files into the yaml
+directory next to its HTML output, e.g., shard1/_build/yaml:
+
+    sphinx-build -b html -D build_modules=module01/index,module02/index . shard1/_build/html
+    sphinx-build -b html -D build_modules=module03/index . shard2/_build/html
+    python3 a-plus-rst-tools/merge_shards.py _build shard1/_build shard2/_build
+
+The HTML and YAML files of the shards are copied into the output directory,
+the indexes are merged and the links are rewritten like at the end of a build
+of the whole course.
+'''
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'directives'))
+
+import lib.shards as shards
+
+
+def main():
+    p = argparse.ArgumentParser(description='Merge the outputs of sharded course builds.')
+    p.add_argument('output', help='output build directory, e.g., _build')
+    p.add_argument('shards', nargs='+', help='build directories of the shards')
+    args = p.parse_args()
+    for shard in args.shards:
+        if not os.path.isfile(os.path.join(shard, 'yaml', shards.SHARD_FILE)):
+            p.error('{} is not the build directory of a shard.'.format(shard))
+    index = shards.merge(args.output, args.shards)
+    print('Merged {:d} shards with {:d} modules into {}'.format(
+        len(args.shards), len(index['modules']), args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import os
 import re
 import shlex
@@ -11,8 +13,11 @@ from sphinx.util import logging
 import aplus_nodes
 import directives.meta
 import lib.yaml_writer as yaml_writer
+import lib.file_hashes as file_hashes
 import lib.html_tools as html_tools
 import lib.toc_languages as toc_languages
+import lib.profiler as profiler
+import lib.shards as shards
 from lib.revealrule import parse_reveal_rule
 
 
@@ -149,26 +154,42 @@ def write(app, exception):
                 raise SphinxError('Language postfix is required (e.g. docname_en): ' + docname)
             lang = docname[(i + 1):]
             logger.info('Traverse document elements to write configuration index ({}).'.format(lang))
-            index = make_index(app, doc, language=lang)
+            with profiler.phase('toc_config.make_index'):
+                index = make_index(app, doc, language=lang)
             yaml_writer.write(yaml_writer.file_path(app.env, 'index_' + lang), index)
             indexes.append((lang, index))
 
         logger.info('Joining language tree to one index.')
-        index = toc_languages.join(app, indexes)
-        append_manual_content(app, index)
-        yaml_writer.write(yaml_writer.file_path(app.env, 'index'), index)
-        keys |= set(m['key'] for m in index['modules'])
+        with profiler.phase('toc_languages.join'):
+            index = toc_languages.join(app, indexes)
 
     else:
         logger.info('Traverse document elements to write configuration index.')
-        index = make_index(app, root)
-        append_manual_content(app, index)
-        yaml_writer.write(yaml_writer.file_path(app.env, 'index'), index)
-        keys |= set(m['key'] for m in index['modules'])
+        with profiler.phase('toc_config.make_index'):
+            index = make_index(app, root)
+
+    append_manual_content(app, index)
+    if app.config.index_defaults and not shards.is_shard(app.config):
+        # The shards are merged from the complete entries.
+        with profiler.phase('toc_config.add_category_defaults'):
+            add_category_defaults(index)
+    yaml_writer.write(yaml_writer.file_path(app.env, 'index'), index)
+    keys |= set(m['key'] for m in index['modules'])
+
+    if shards.is_shard(app.config):
+        # The links are rewritten when the shards are merged.
+        shards.write_info(app, index)
+        return
 
     # Rewrite links for remote inclusion.
     keys |= {'toc', 'user', 'account'}
-    html_tools.rewrite_outdir(app.outdir, keys, app.config.static_host)
+    with profiler.phase('html_tools.rewrite_outdir'):
+        html_tools.rewrite_outdir(app.outdir, keys, app.config.static_host,
+            app.config.lazy_load_media, app.config.add_image_sizes, app.env.yaml_dir)
+
+    if app.config.index_fingerprints:
+        with profiler.phase('toc_config.add_fingerprints'):
+            add_fingerprints(yaml_writer.file_path(app.env, 'index'), app.outdir, app.env.yaml_dir)
 
 
 def make_index(app, root, language=''):
@@ -440,6 +461,8 @@ def make_index(app, root, language=''):
         'unprotected_paths': unprotected_paths,
         'configures': app.config.course_configures,
     }
+    if app.config.configure_file_hashes:
+        index['configures'] = file_hashes.add_course_configure_hashes(app.srcdir, app.config.course_configures)
     index['lang'] = language if language else app.config.language
 
     course_enrollment_start = course_meta.get('enrollment-start')
@@ -500,28 +523,107 @@ def make_index(app, root, language=''):
     return index
 
 
-def append_manual_content(app, index):
+def add_fingerprints(index_path, html_dir, yaml_dir):
+    ''' Adds the hashes of the exercise configs (config_hash) and the chapter
+    pages (static_content_hash) to the index. The files are hashed after the
+    links have been rewritten, so the hashes change only if the output does. '''
+
+    def file_hash(path):
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def static_content_hash(value):
+        if isinstance(value, dict):
+            # Multilingual chapters have a page for each language.
+            h = hashlib.sha256()
+            for lang in sorted(value):
+                h.update('{}:{}\n'.format(lang, file_hash(os.path.join(html_dir, value[lang]))).encode('utf-8'))
+            return h.hexdigest()
+        return file_hash(os.path.join(html_dir, value))
+
+    def add(entries):
+        for entry in entries:
+            try:
+                if isinstance(entry.get('config'), str):
+                    entry['config_hash'] = file_hash(os.path.join(yaml_dir, entry['config']))
+                if entry.get('static_content'):
+                    entry['static_content_hash'] = static_content_hash(entry['static_content'])
+            except OSError as error:
+                logger.warning('No fingerprint for {}: {}'.format(entry.get('key'), error))
+            add(entry.get('children', []))
+
+    index = yaml_writer.read(index_path)
+    for module in index.get('modules', []):
+        add(module.get('children', []))
+    yaml_writer.write(index_path, index)
+
+
+def add_category_defaults(index):
+    ''' Moves the values that the chapters and exercises of a category share
+    into index['defaults'][category] and removes them from the entries. A
+    field is moved only if every entry of the category has it, so the entries
+    are restored by adding the missing fields from the defaults of their
+    category. '''
+
+    def collect(entries):
+        for entry in entries:
+            if 'category' in entry:
+                by_category.setdefault(entry['category'], []).append(entry)
+            collect(entry.get('children', []))
+
+    by_category = {}
+    for module in index.get('modules', []):
+        collect(module.get('children', []))
+
+    defaults = {}
+    for category, entries in by_category.items():
+        if len(entries) < 2:
+            continue
+        fields = set.intersection(*(set(entry) for entry in entries)) - {'key', 'category', 'children'}
+        category_defaults = {}
+        for field in sorted(fields):
+            counts = {}
+            for entry in entries:
+                value = json.dumps(entry[field], sort_keys=True, default=str)
+                counts[value] = counts.get(value, 0) + 1
+            value, count = max(counts.items(), key=lambda item: item[1])
+            if count < 2:
+                continue
+            for entry in entries:
+                if json.dumps(entry[field], sort_keys=True, default=str) == value:
+                    category_defaults[field] = entry.pop(field)
+        if category_defaults:
+            defaults[category] = category_defaults
+    if defaults:
+        index['defaults'] = defaults
+
+
+def merge_config(config, append, skip_equal=False):
+    ''' Merges the append dict or list into the config recursively. List
+    entries with the same key are merged and the other entries are appended.
+    If skip_equal is set, entries equal to an existing entry are not
+    appended again. '''
+    if type(append) == dict:
+        for key,val in append.items():
+            if not key in config:
+                config[key] = val
+            else:
+                merge_config(config[key], append[key], skip_equal)
+    elif type(append) == list:
+        for entry in append:
+            add = True
+            if 'key' in entry:
+                for old in config:
+                    if 'key' in old and old['key'] == entry['key']:
+                        merge_config(old, entry, skip_equal)
+                        add = False
+            if add and not (skip_equal and entry in config):
+                config.append(entry)
 
-    def recursive_merge(config, append):
-        if type(append) == dict:
-            for key,val in append.items():
-                if not key in config:
-                    config[key] = val
-                else:
-                    recursive_merge(config[key], append[key])
-        elif type(append) == list:
-            for entry in append:
-                add = True
-                if 'key' in entry:
-                    for old in config:
-                        if 'key' in old and old['key'] == entry['key']:
-                            recursive_merge(old, entry)
-                            add = False
-                if add:
-                    config.append(entry)
 
+def append_manual_content(app, index):
     for path in app.config.append_content:
-        recursive_merge(index, yaml_writer.read(path))
+        merge_config(index, yaml_writer.read(path))
 
 
 def traverse_tocs(app, doc):
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+'''
+Watch mode: rebuilds the course whenever its files change.
+
+The Sphinx application stays in memory between the builds, so a rebuild
+only reads and writes the documents that are affected by the change. Sphinx
+finds them from the modification times of the RST files and of the files
+that the directives depend on, such as the config YAML files of the submit
+directive and the templates of the clickable ae-input directive. Changes in
+the append_content files only rerun the index stage at the end of the build.
+A change in conf.py restarts the application.
+
+The build output is served over HTTP. The served HTML pages connect back to
+the watcher over a websocket, and the pages are reloaded after each build
+that changed the output.
+
+Example (in the course directory):
+
+    python3 a-plus-rst-tools/watch.py
+    python3 a-plus-rst-tools/watch.py --port 8080 . _build/html
+'''
+import argparse
+import base64
+import hashlib
+import http.server
+import os
+import sys
+import threading
+import time
+import traceback
+from functools import partial
+
+
+RELOAD_PATH = '/_aplus_watch'
+RELOAD_SCRIPT = '''<script>
+(function () {
+  function connect(reload) {
+    var ws = new WebSocket((location.protocol == 'https:' ? 'wss://' : 'ws://') + location.host + '%s');
+    ws.onopen = function () { if (reload) location.reload(); };
+    ws.onmessage = function () { location.reload(); };
+    ws.onclose = function () { setTimeout(function () { connect(true); }, 1000); };
+  }
+  connect(false);
+})();
+</script>
+''' % RELOAD_PATH
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Files that editors write next to the edited file.
+IGNORED_SUFFIXES = ('~', '.swp', '.swx', '.tmp')
+
+
+class ReloadHandler(http.server.SimpleHTTPRequestHandler):
+    ''' Serves the build output and the reload websocket. '''
+
+    def do_GET(self):
+        if self.path == RELOAD_PATH and self.headers.get('Upgrade', '').lower() == 'websocket':
+            self.handle_websocket()
+            return
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, 'index.html')
+        if path.endswith('.html') and os.path.isfile(path) and self.path.endswith(('/', '.html')):
+            self.send_html(path)
+            return
+        super().do_GET()
+
+    def send_html(self, path):
+        with open(path, 'rb') as f:
+            content = f.read()
+        i = content.rfind(b'</body>')
+        if i < 0:
+            i = len(content)
+        content = content[:i] + RELOAD_SCRIPT.encode('utf-8') + content[i:]
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def handle_websocket(self):
+        key = self.headers.get('Sec-WebSocket-Key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest())
+        self.send_response(101)
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', accept.decode('ascii'))
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        self.server.add_client(self.connection)
+        try:
+            # The client sends nothing but pings and the close frame.
+            while read_frame(self.rfile) not in (None, 0x8):
+                pass
+        except OSError:
+            pass
+        finally:
+            self.server.remove_client(self.connection)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def read_frame(stream):
+    ''' Reads a client frame and returns its opcode or None at the end. '''
+    header = stream.read(2)
+    if len(header) < 2:
+        return None
+    length = header[1] & 0x7f
+    if length == 126:
+        length = int.from_bytes(stream.read(2), 'big')
+    elif length == 127:
+        length = int.from_bytes(stream.read(8), 'big')
+    # Mask and payload.
+    stream.read(4 + length if header[1] & 0x80 else length)
+    return header[0] & 0x0f
+
+
+class ReloadServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, directory):
+        super().__init__(address, partial(ReloadHandler, directory=directory))
+        self.clients = set()
+        self.lock = threading.Lock()
+
+    def add_client(self, connection):
+        with self.lock:
+            self.clients.add(connection)
+
+    def remove_client(self, connection):
+        with self.lock:
+            self.clients.discard(connection)
+
+    def notify(self, message='reload'):
+        ''' Sends the message to all open pages. '''
+        data = message.encode('utf-8')
+        frame = bytes([0x81, len(data)]) + data
+        with self.lock:
+            for connection in list(self.clients):
+                try:
+                    connection.sendall(frame)
+                except OSError:
+                    self.clients.discard(connection)
+
+
+def make_app(args):
+    from sphinx.application import Sphinx
+    return Sphinx(
+        args.sourcedir, args.sourcedir, args.outputdir, args.doctreedir, 'html',
+        status=None if args.quiet else sys.stdout, warning=sys.stderr,
+        parallel=args.jobs,
+    )
+
+
+def watched_files(app):
+    ''' Returns the modification times and sizes of the watched files. '''
+    build_dirs = {
+        os.path.abspath(app.outdir),
+        os.path.abspath(app.doctreedir),
+        os.path.join(os.path.abspath(app.confdir), '_build'),
+    }
+    suffixes = tuple(app.config.source_suffix) + ('.yaml', '.yml', '.html')
+    paths = {os.path.join(app.confdir, 'conf.py')}
+    for root, dirnames, filenames in os.walk(app.srcdir):
+        dirnames[:] = [
+            d for d in dirnames
+            if not d.startswith('.') and os.path.abspath(os.path.join(root, d)) not in build_dirs
+        ]
+        paths.update(
+            os.path.join(root, f) for f in filenames
+            if f.endswith(suffixes) and not f.startswith('.')
+        )
+    for dependencies in app.env.dependencies.values():
+        paths.update(os.path.join(app.srcdir, path) for path in dependencies)
+    paths.update(os.path.join(app.confdir, path) for path in app.config.append_content)
+
+    files = {}
+    for path in paths:
+        if path.endswith(IGNORED_SUFFIXES):
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        files[os.path.normpath(path)] = (st.st_mtime_ns, st.st_size)
+    return files
+
+
+def output_files(app):
+    files = {}
+    for directory in (app.outdir, os.path.join(app.confdir, '_build', 'yaml')):
+        for root, dirnames, filenames in os.walk(directory):
+            for f in filenames:
+                path = os.path.join(root, f)
+                try:
+                    files[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    pass
+    return files
+
+
+def build(app):
+    ''' Builds the changed documents. Returns the number of changed
+    output files or None if the build failed. '''
+    before = output_files(app)
+    try:
+        app.build()
+    except Exception:
+        traceback.print_exc()
+        return None
+    if app.statuscode:
+        return None
+    after = output_files(app)
+    return sum(1 for path, mtime in after.items() if before.get(path) != mtime) \
+        + sum(1 for path in before if path not in after)
+
+
+def changed_paths(old, new):
+    return sorted(path for path in set(old) | set(new) if old.get(path) != new.get(path))
+
+
+def main():
+    p = argparse.ArgumentParser(description='Rebuild the course when its files change.')
+    p.add_argument('sourcedir', nargs='?', default='.', help='course directory (default: .)')
+    p.add_argument('outputdir', nargs='?', help='output directory (default: _build/html)')
+    p.add_argument('--host', default='127.0.0.1', help='address of the preview server')
+    p.add_argument('--port', type=int, default=8000, help='port of the preview server, 0 disables it')
+    p.add_argument('--interval', type=float, default=0.3, help='seconds between the file checks')
+    p.add_argument('-j', '--jobs', type=int, default=1, help='parallel jobs of the builds')
+    p.add_argument('-q', '--quiet', action='store_true', help='show only the warnings of the builds')
+    args = p.parse_args()
+    args.sourcedir = os.path.abspath(args.sourcedir)
+    args.outputdir = os.path.abspath(args.outputdir or os.path.join(args.sourcedir, '_build', 'html'))
+    args.doctreedir = os.path.join(os.path.dirname(args.outputdir), 'doctrees')
+    # The relative paths of the configuration, e.g., append_content, are
+    # relative to the course directory like in sphinx-build.
+    os.chdir(args.sourcedir)
+
+    app = make_app(args)
+    build(app)
+
+    server = None
+    if args.port:
+        server = ReloadServer((args.host, args.port), app.outdir)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print('Serving the course at http://{}:{:d}/'.format(args.host, server.server_address[1]))
+    print('Watching {} for changes. Press Ctrl+C to stop.'.format(args.sourcedir), flush=True)
+
+    conf = os.path.join(app.confdir, 'conf.py')
+    files = watched_files(app)
+    try:
+        while True:
+            time.sleep(args.interval)
+            new_files = watched_files(app)
+            changes = changed_paths(files, new_files)
+            if not changes:
+                continue
+            for path in changes:
+                print('Changed: {}'.format(os.path.relpath(path, args.sourcedir)))
+            start = time.perf_counter()
+            changed = None
+            if conf in changes:
+                print('Restarting the build because conf.py changed.')
+                try:
+                    app = make_app(args)
+                except Exception:
+                    traceback.print_exc()
+                else:
+                    changed = build(app)
+            else:
+                changed = build(app)
+            if changed is None:
+                print('The build failed, waiting for changes.', flush=True)
+            else:
+                print('Rebuilt in {:.2f} s, {:d} output files changed.'.format(
+                    time.perf_counter() - start, changed), flush=True)
+                if changed and server:
+                    server.notify()
+            # The files that the build added to the dependencies are watched
+            # from now on. Other changes during the build are noticed on the
+            # next check.
+            files = dict(watched_files(app), **new_files)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server:
+            server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())